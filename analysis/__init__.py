@@ -2,6 +2,10 @@
 Модуль для анализа данных айтрекинга и построения тепловых карт
 """
 
-from .heatmap_analyzer import create_gaze_heatmap, analyze_all_gaze_files
+from .heatmap_analyzer import (
+    create_gaze_heatmap, analyze_all_gaze_files, analyze_gaze_files_batch,
+    create_aggregate_heatmap, AggregateHeatmap,
+)
 
-__all__ = ['create_gaze_heatmap', 'analyze_all_gaze_files'] 
\ No newline at end of file
+__all__ = ['create_gaze_heatmap', 'analyze_all_gaze_files', 'analyze_gaze_files_batch',
+           'create_aggregate_heatmap', 'AggregateHeatmap'] 
\ No newline at end of file
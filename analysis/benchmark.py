@@ -0,0 +1,202 @@
+"""
+Замеры производительности этапов анализа тепловых карт.
+
+Для каждого размера синтетической сессии и размера сетки замеряются
+время, пиковая память (tracemalloc) и скорость в точках в секунду для
+загрузки (CSV и .npy), фильтрации, KDE, взвешенного KDE, плотности
+в разрешении стимула и записи PNG. Результаты сохраняются в JSON,
+чтобы сравнивать запуски между собой.
+
+Пример: python -m analysis.benchmark --sizes 1000 10000 --grids 100 200
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import scipy
+
+from .heatmap_analyzer import (
+    GazeAnalysisContext, compute_kde, create_clean_heatmap_png, create_weighted_kde_heatmap,
+    filter_and_normalize_gaze_data, load_gaze_data,
+)
+
+DEFAULT_SIZES = (1_000, 10_000, 100_000, 1_000_000)
+DEFAULT_GRIDS = (100, 200, 400)
+
+# Границы калибровки синтетических сессий (экран трекера в координатах POG)
+SYNTHETIC_BOUNDARIES = {'x_min': 0.05, 'x_max': 0.95, 'y_min': 0.05, 'y_max': 0.95}
+
+
+def generate_gaze_data(n_points, seed=0, n_clusters=8):
+    """
+    Синтетическая сессия: фиксации вокруг нескольких зон интереса
+    и равномерный фон, T по возрастанию, Tn с экспоненциальным распределением
+
+    Returns:
+        tuple: (x, y, T, Tn)
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0.15, 0.85, size=(n_clusters, 2))
+    spreads = rng.uniform(0.01, 0.05, size=n_clusters)
+
+    n_background = n_points // 10
+    labels = rng.integers(0, n_clusters, n_points - n_background)
+    x = np.concatenate([rng.normal(centers[labels, 0], spreads[labels]), rng.uniform(0, 1, n_background)])
+    y = np.concatenate([rng.normal(centers[labels, 1], spreads[labels]), rng.uniform(0, 1, n_background)])
+    order = rng.permutation(n_points)
+
+    T = np.sort(rng.uniform(0, n_points * 250.0, n_points))
+    Tn = rng.exponential(250.0, n_points)
+    return x[order], y[order], T, Tn
+
+
+def write_synthetic_session(directory, n_points, seed=0):
+    """Записывает синтетическую сессию в CSV и .npy, возвращает пути к файлам"""
+    x, y, T, Tn = generate_gaze_data(n_points, seed)
+    csv_filename = os.path.join(directory, f"gaze_data_bench_{n_points}.csv")
+    npy_filename = os.path.join(directory, f"gaze_data_bench_{n_points}.npy")
+
+    pd.DataFrame({'x': x, 'y': y, 'T': T, 'Tn': Tn}).to_csv(csv_filename, index=False)
+    records = np.empty(n_points, dtype=[(column, '<f8') for column in ('x', 'y', 'T', 'Tn')])
+    records['x'], records['y'], records['T'], records['Tn'] = x, y, T, Tn
+    np.save(npy_filename, records)
+    return csv_filename, npy_filename
+
+
+def measure(stage, func, n_points, repeat=3, **info):
+    """
+    Замеряет этап: лучшее время из repeat запусков и пиковую память одного запуска
+
+    Returns:
+        dict: результат замера
+    """
+    times = []
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = min(times)
+    result = dict(stage=stage, points=n_points, seconds=seconds, peak_memory_mb=peak / 2 ** 20,
+                  points_per_second=n_points / seconds if seconds > 0 else None, **info)
+    extra = ' '.join(f"{key}={value}" for key, value in info.items())
+    print(f"   {stage:<22} {n_points:>9} точек {extra:<28} {seconds * 1000:>10.1f} мс "
+          f"{result['peak_memory_mb']:>9.1f} МБ")
+    return result
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, grids=DEFAULT_GRIDS, method='fft', repeat=3,
+                   resolution=(1920, 1080)):
+    """
+    Прогоняет все этапы для каждого размера сессии и сетки
+
+    Returns:
+        list: результаты замеров
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_points in sizes:
+            print(f"📏 Сессия из {n_points} точек")
+            csv_filename, npy_filename = write_synthetic_session(directory, n_points)
+
+            results.append(measure('load_csv', lambda: load_gaze_data(csv_filename), n_points, repeat))
+            results.append(measure('load_npy', lambda: [np.array(column) for column in load_gaze_data(npy_filename)],
+                                   n_points, repeat))
+
+            x, y, T, Tn = load_gaze_data(csv_filename)
+            results.append(measure('filter_normalize',
+                                   lambda: filter_and_normalize_gaze_data(x, y, T, Tn, SYNTHETIC_BOUNDARIES),
+                                   n_points, repeat))
+            with contextlib.redirect_stdout(io.StringIO()):
+                x, y, T, Tn = filter_and_normalize_gaze_data(x, y, T, Tn, SYNTHETIC_BOUNDARIES)
+            data = np.vstack([x, y])
+            weights = GazeAnalysisContext(x, y, (0, 1), (0, 1), T=T).T_normalized
+
+            for grid_size in grids:
+                results.append(measure('compute_kde', lambda: compute_kde(data, (0, 1), (0, 1), grid_size, method),
+                                       n_points, repeat, grid_size=grid_size, method=method))
+                results.append(measure('weighted_kde',
+                                       lambda: create_weighted_kde_heatmap(x, y, weights, (0, 1), (0, 1),
+                                                                           grid_size, method),
+                                       n_points, repeat, grid_size=grid_size, method=method))
+
+            context = GazeAnalysisContext(x, y, (0, 1), (0, 1), method=method)
+            width, height = resolution
+            results.append(measure('density_at_resolution', lambda: context.density_at_resolution(width, height),
+                                   n_points, repeat, resolution=f"{width}x{height}"))
+
+            Z = context.Z_kde
+            png_filename = os.path.join(directory, "heatmap.png")
+            results.append(measure('write_png', lambda: create_clean_heatmap_png(Z, png_filename, width, height),
+                                   n_points, repeat, resolution=f"{width}x{height}"))
+    return results
+
+
+def environment_info():
+    """Параметры окружения, от которых зависят результаты"""
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def save_results(results, output_dir="data/benchmarks", **settings):
+    """Сохраняет результаты с параметрами запуска в JSON, возвращает путь к файлу"""
+    os.makedirs(output_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = os.path.join(output_dir, f"benchmark_{timestamp}.json")
+    report = {
+        'created': datetime.now().isoformat(),
+        'environment': environment_info(),
+        'settings': settings,
+        'results': results,
+    }
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    return filename
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры производительности анализа тепловых карт")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help="размеры синтетических сессий в точках")
+    parser.add_argument('--grids', type=int, nargs='+', default=list(DEFAULT_GRIDS),
+                        help="размеры сетки KDE")
+    parser.add_argument('--method', choices=('fft', 'scipy'), default='fft', help="метод KDE")
+    parser.add_argument('--repeat', type=int, default=3, help="количество повторов каждого замера")
+    parser.add_argument('--output-dir', default="data/benchmarks", help="папка для JSON с результатами")
+    args = parser.parse_args()
+
+    print("⏱️  Замеры производительности анализа тепловых карт")
+    print("=" * 50)
+    results = run_benchmarks(args.sizes, args.grids, args.method, args.repeat)
+    filename = save_results(results, args.output_dir, sizes=args.sizes, grids=args.grids,
+                            method=args.method, repeat=args.repeat)
+    print(f"📁 Результаты сохранены: {filename}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
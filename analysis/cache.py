@@ -0,0 +1,118 @@
+"""
+Кеш результатов анализа сессий.
+
+Ключ записи - хеш содержимого файла данных, границ калибровки и
+параметров анализа (размер сетки, метод, ширина окна, веса). Пока ни
+одно из них не изменилось, повторный анализ берет матрицы плотности из
+кеша, а не считает KDE заново.
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+# Версия формата записей: при изменении расчета старые записи не подходят
+CACHE_VERSION = 1
+
+
+class AnalysisCache:
+    """Записи кеша хранятся в файлах <ключ>.npz, устаревшие удаляются по возрасту и объему"""
+
+    def __init__(self, cache_dir="data/analysis/cache", max_age_days=30, max_size_mb=500):
+        """
+        Args:
+            cache_dir: папка кеша
+            max_age_days: записи, к которым не обращались дольше, удаляются
+            max_size_mb: предельный объем кеша, сверх него удаляются самые старые записи
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_age = max_age_days * 24 * 3600
+        self.max_size = max_size_mb * 1024 * 1024
+
+    def make_key(self, filename, boundaries, params):
+        """
+        Вычисляет ключ записи
+
+        Args:
+            filename: файл с данными сессии (хешируется содержимое)
+            boundaries: границы калибровки или None
+            params: параметры анализа (словарь, сериализуемый в JSON)
+        """
+        digest = hashlib.sha256()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        settings = {'version': CACHE_VERSION, 'boundaries': boundaries, 'params': params}
+        digest.update(json.dumps(settings, sort_keys=True, default=float).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.npz"
+
+    def get(self, key):
+        """Возвращает сохраненные матрицы {имя: массив} или None"""
+        path = self._path(key)
+        try:
+            with np.load(path) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except (OSError, ValueError):
+            return None
+        # Время изменения служит временем последнего обращения при очистке
+        os.utime(path)
+        return arrays
+
+    def put(self, key, arrays):
+        """Сохраняет матрицы под ключом и очищает устаревшие записи"""
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self._path(key)
+        # Уникальное имя для каждого писателя; суффикс .tmp не попадает под *.npz в evict
+        temp_path = self.cache_dir / f"{key}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp_path, path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Удаляет записи старше max_age и самые старые сверх max_size.
+        Временные файлы идущих записей не трогаются, кроме брошенных старше max_age.
+        """
+        if not self.cache_dir.exists():
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for path in self.cache_dir.glob("*.tmp"):
+            try:
+                if now - path.stat().st_mtime > self.max_age:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                continue
+        for path in self.cache_dir.glob("*.npz"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+                removed += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        return removed
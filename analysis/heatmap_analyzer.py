@@ -2,20 +2,34 @@ import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy.stats import gaussian_kde
+from scipy.signal import fftconvolve
 import pandas as pd
 import os
+import json
 from datetime import datetime
 from scipy.ndimage import gaussian_filter
 import glob
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import cached_property, lru_cache
 from pathlib import Path
+from PIL import Image
+
+from .cache import AnalysisCache
 
 
 def load_gaze_data(csv_filename):
     """
+    Загружает запись трекера из CSV или двоичного .npy файла.
+    .npy отображается в память (mmap) без копирования и разбора текста.
+
     Returns:
         tuple: (x, y, T, Tn) массивы данных
     """
     try:
+        if str(csv_filename).endswith('.npy'):
+            return load_gaze_data_binary(csv_filename)
+        
         df = pd.read_csv(csv_filename)
         
         if not all(col in df.columns for col in ['x', 'y', 'T', 'Tn']):
@@ -34,8 +48,30 @@ def load_gaze_data(csv_filename):
         return None, None, None, None
 
 
+def load_gaze_data_binary(npy_filename):
+    """
+    Отображает двоичную запись трекера (.npy со структурным типом) в память.
+    
+    Returns:
+        tuple: (x, y, T, Tn) - представления колонок без копирования
+    """
+    records = np.load(npy_filename, mmap_mode='r')
+    names = records.dtype.names or ()
+    if not all(col in names for col in ['x', 'y', 'T', 'Tn']):
+        raise ValueError("Файл .npy не содержит необходимых колонок: x, y, T, Tn")
+    return records['x'], records['y'], records['T'], records['Tn']
+
+
+def find_gaze_files(include_root=False):
+    """Возвращает файлы записей трекера (CSV и двоичные .npy)"""
+    patterns = ["data/raw/gaze_data_*.csv", "data/raw/gaze_data_*.npy"]
+    if include_root:
+        patterns += ["gaze_data_*.csv", "gaze_data_*.npy"]
+    return [path for pattern in patterns for path in glob.glob(pattern)]
+
+
 def find_latest_gaze_file():
-    gaze_files = glob.glob("data/raw/gaze_data_*.csv")
+    gaze_files = find_gaze_files()
     if not gaze_files:
         return None
     
@@ -47,37 +83,82 @@ def setup_theme():
     sns.set_theme(style="white", context="paper")
 
 
-def extract_boundaries_from_calibration(data_dir="data/raw"):
-    """Извлекает границы приложения из файлов калибровки"""
+CALIBRATION_FILES = ("calib1.csv", "calib2.csv", "calib3.csv", "calib4.csv")
+
+# Файл с сохраненными границами рядом с файлами калибровки
+BOUNDARIES_CACHE_FILE = "calibration_boundaries.json"
+
+
+def load_calibration_points(file_path):
+    """Читает только колонки x, y файла калибровки в массивы float64"""
+    df = pd.read_csv(file_path, usecols=['x', 'y'], dtype=np.float64)
+    return df['x'].to_numpy(), df['y'].to_numpy()
+
+
+def _calibration_signature(data_path):
+    """Размер и время изменения файлов калибровки (None для отсутствующих)"""
+    signature = {}
+    for file in CALIBRATION_FILES:
+        try:
+            stat = (data_path / file).stat()
+            signature[file] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            signature[file] = None
+    return signature
+
+
+def extract_boundaries_from_calibration(data_dir="data/raw", use_cache=True):
+    """
+    Извлекает границы приложения из файлов калибровки.
+    
+    Границы сохраняются в calibration_boundaries.json рядом с файлами
+    калибровки и используются повторно, пока эти файлы не изменятся.
+    """
     data_path = Path(data_dir)
-    calib_files = [
-        "calib1.csv", "calib2.csv", "calib3.csv", "calib4.csv"
-    ]
+    cache_path = data_path / BOUNDARIES_CACHE_FILE
+    signature = _calibration_signature(data_path)
+    
+    if use_cache and cache_path.exists():
+        try:
+            with open(cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+            if cached.get('files') == signature:
+                return cached['boundaries']
+        except (OSError, ValueError, KeyError):
+            pass
     
     all_x, all_y = [], []
     
-    for file in calib_files:
-        file_path = data_path / file
-        if file_path.exists():
-            df = pd.read_csv(file_path)
-            all_x.extend(df['x'].tolist())
-            all_y.extend(df['y'].tolist())
+    for file in CALIBRATION_FILES:
+        if signature[file] is not None:
+            x, y = load_calibration_points(data_path / file)
+            all_x.append(x)
+            all_y.append(y)
             print(f"✅ Обработан файл калибровки: {file}")
         else:
             print(f"⚠️  Файл калибровки не найден: {file}")
     
-    if not all_x:
+    all_x = np.concatenate(all_x) if all_x else np.empty(0)
+    all_y = np.concatenate(all_y) if all_y else np.empty(0)
+    if all_x.size == 0:
         return None
     
     # Вычисляем границы как min/max значения
     boundaries = {
-        'x_min': np.min(all_x),
-        'x_max': np.max(all_x),
-        'y_min': np.min(all_y),
-        'y_max': np.max(all_y)
+        'x_min': float(all_x.min()),
+        'x_max': float(all_x.max()),
+        'y_min': float(all_y.min()),
+        'y_max': float(all_y.max())
     }
     
     print(f"📊 Извлечены границы: x=[{boundaries['x_min']:.3f}, {boundaries['x_max']:.3f}], y=[{boundaries['y_min']:.3f}, {boundaries['y_max']:.3f}]")
+    
+    if use_cache:
+        try:
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump({'files': signature, 'boundaries': boundaries}, f, indent=2)
+        except OSError as e:
+            print(f"⚠️  Не удалось сохранить границы калибровки: {e}")
     return boundaries
 
 
@@ -126,98 +207,158 @@ def save_heatmap_transparent(fig, filename="heatmap_transparent.png"):
 
 def create_clean_heatmap_image(Z_kde, x_range, y_range, filename="heatmap_clean.png"):
     """Создает чистое изображение тепловой карты 16:9 без шкалы и с прозрачными нулевыми областями"""
+    # 16x9 дюймов при 300 dpi, как у прежнего сохранения через matplotlib
+    create_clean_heatmap_png(Z_kde, filename, width=4800, height=2700, alpha='mask')
+    print(f"💾 Чистое изображение тепловой карты сохранено: {filename}")
+
+
+# Доля максимума плотности, начиная с которой тепловая карта полностью непрозрачна
+ALPHA_RAMP = 0.3
+
+
+@lru_cache(maxsize=None)
+def heatmap_lut(cmap='Spectral_r', alpha='density', levels=256):
+    """
+    Таблица цветов RGBA (levels x 4, uint8) для уровней плотности [0;1]
     
-    # Создаем фигуру в точном соотношении 16:9 без осей и отступов
-    fig = plt.figure(figsize=(16, 9))
-    ax = fig.add_axes((0, 0, 1, 1))  # Заполняем всю фигуру
-    ax.set_xlim(x_range[0], x_range[1])
-    ax.set_ylim(y_range[0], y_range[1])
-    ax.axis('off')  # Убираем все оси и подписи
+    Args:
+        alpha: 'density' - прозрачность растет с плотностью до ALPHA_RAMP,
+               'mask' - прозрачен только нулевой уровень
+    """
+    values = np.linspace(0, 1, levels)
+    lut = plt.get_cmap(cmap)(values)
+    if alpha == 'density':
+        lut[:, 3] = np.clip(values / ALPHA_RAMP, 0, 1)
+    else:
+        lut[0, 3] = 0
+    return np.round(lut * 255).astype(np.uint8)
+
+
+def resize_bilinear(Z, width, height):
+    """Билинейное масштабирование матрицы до height x width"""
+    rows = np.linspace(0, Z.shape[0] - 1, height)
+    cols = np.linspace(0, Z.shape[1] - 1, width)
+    r0 = np.minimum(rows.astype(int), Z.shape[0] - 2)
+    c0 = np.minimum(cols.astype(int), Z.shape[1] - 2)
+    fr = (rows - r0)[:, None]
+    fc = cols - c0
     
-    # Создаем маску для нулевых значений
-    Z_masked = np.ma.masked_where(Z_kde == 0, Z_kde)
+    # Сначала по строкам, затем по столбцам
+    Z_rows = Z[r0] * (1 - fr) + Z[r0 + 1] * fr
+    return Z_rows[:, c0] * (1 - fc) + Z_rows[:, c0 + 1] * fc
+
+
+def heatmap_to_rgba(Z_kde, width=1920, height=1080, cmap='Spectral_r', alpha='density'):
+    """
+    Переводит матрицу плотности в изображение RGBA (height x width x 4, uint8)
+    через таблицу цветов, без построения фигуры matplotlib
+    """
+    Z = np.asarray(Z_kde, dtype=np.float64)
+    if Z.shape != (height, width):
+        Z = resize_bilinear(Z, width, height)
+    Z_max = Z.max()
+    lut = heatmap_lut(cmap, alpha)
+    if Z_max > 0:
+        levels = np.rint(Z * ((len(lut) - 1) / Z_max)).astype(np.intp)
+    else:
+        levels = np.zeros(Z.shape, dtype=np.intp)
+    # Строка 0 матрицы соответствует низу изображения (origin='lower')
+    return lut[levels[::-1]]
+
+
+def create_clean_heatmap_png(Z_kde, filename="heatmap_clean.png", width=1920, height=1080,
+                             cmap='Spectral_r', alpha='density', compress_level=1):
+    """
+    Сохраняет тепловую карту 16:9 с прозрачным фоном, PNG кодируется один раз
     
-    # Отображаем тепловую карту с прозрачностью для нулевых значений
-    im = ax.imshow(Z_masked, extent=(x_range[0], x_range[1], y_range[0], y_range[1]), 
-                   origin='lower', cmap='Spectral_r', interpolation='bilinear', 
-                   aspect='equal')
+    Args:
+        compress_level: степень сжатия PNG (0-9), меньше - быстрее и больше файл
+    """
+    rgba = heatmap_to_rgba(Z_kde, width, height, cmap, alpha)
+    Image.fromarray(rgba, 'RGBA').save(filename, compress_level=compress_level)
+
+
+def build_heatmap_pyramid(Z, min_width=240):
+    """
+    Многоуровневое представление плотности: каждый следующий уровень
+    вдвое меньше предыдущего (среднее по блокам 2x2)
     
-    # Сохраняем без отступов и с прозрачным фоном
-    fig.savefig(filename, dpi=300, bbox_inches='tight', pad_inches=0,
-                facecolor='none', edgecolor='none', transparent=True)
+    Returns:
+        list: матрицы от полного разрешения до ширины не меньше min_width
+    """
+    levels = [np.asarray(Z)]
+    while levels[-1].shape[1] // 2 >= min_width and levels[-1].shape[0] >= 2:
+        Z = levels[-1]
+        h, w = Z.shape[0] // 2 * 2, Z.shape[1] // 2 * 2
+        levels.append(Z[:h, :w].reshape(h // 2, 2, w // 2, 2).mean(axis=(1, 3)))
+    return levels
+
+
+def save_heatmap_pyramid(Z, base_filename, min_width=240):
+    """
+    Сохраняет уменьшенные уровни пирамиды в PNG <base>_<ширина>x<высота>.png, чтобы
+    интерфейс мог сначала загрузить маленькое превью, а затем полную карту.
+    Уровень 0 (полное разрешение) - это <base>.png, он сохраняется отдельно
     
-    plt.close(fig)  # Закрываем фигуру чтобы не отображать
-    print(f"💾 Чистое изображение тепловой карты сохранено: {filename}")
+    Returns:
+        list: имена файлов от крупного уровня к превью
+    """
+    filenames = []
+    for level in build_heatmap_pyramid(Z, min_width)[1:]:
+        height, width = level.shape
+        filename = f"{base_filename}_{width}x{height}.png"
+        create_clean_heatmap_png(level, filename, width, height)
+        filenames.append(filename)
+    return filenames
+
+
+def pyramid_level_sizes(width, height, min_width=240):
+    """Размеры (ширина, высота) уровней пирамиды, которые построит build_heatmap_pyramid"""
+    sizes = [(width, height)]
+    while sizes[-1][0] // 2 >= min_width and sizes[-1][1] >= 2:
+        width, height = sizes[-1]
+        sizes.append((width // 2, height // 2))
+    return sizes
+
+
+def heatmap_output_files(test_name, resolution=(1920, 1080), pyramid=False):
+    """
+    Изображения, которые create_gaze_heatmap сохраняет при данных настройках
+    
+    Returns:
+        dict: имя файла -> (ширина, высота)
+    """
+    width, height = resolution or (1920, 1080)
+    outputs = {f"{test_name}.png": (width, height)}
+    if resolution and pyramid:
+        # Уровень 0 пирамиды - сам <тест>.png
+        outputs.update({f"{test_name}_{w}x{h}.png": (w, h) for w, h in pyramid_level_sizes(width, height)[1:]})
+    return outputs
+
+
+def heatmap_outputs_exist(outputs):
+    """Проверяет, что все изображения есть и имеют нужный размер (читается только заголовок PNG)"""
+    for filename, size in outputs.items():
+        try:
+            with Image.open(filename) as image:
+                if image.size != size:
+                    return False
+        except (OSError, ValueError):
+            return False
+    return True
 
 
 def create_clean_heatmap_opencv(Z_kde, x_range, y_range, filename="heatmap_clean_cv.png"):
-    """Создает чистое изображение 16:9 и удаляет фиолетовый фон через OpenCV"""
-    try:
-        import cv2
-        
-        # Создаем изображение с точным соотношением 16:9
-        width, height = 1920, 1080  
-        fig = plt.figure(figsize=(width/100, height/100))
-        ax = fig.add_axes((0, 0, 1, 1))
-        ax.set_xlim(x_range[0], x_range[1])
-        ax.set_ylim(y_range[0], y_range[1])
-        ax.axis('off')
-        
-        im = ax.imshow(Z_kde, extent=(x_range[0], x_range[1], y_range[0], y_range[1]), 
-                       origin='lower', cmap='Spectral_r', interpolation='bilinear', 
-                       aspect='auto')
-        
-        temp_filename = "temp_heatmap.png"
-        fig.savefig(temp_filename, dpi=100, bbox_inches='tight', pad_inches=0,
-                    facecolor='black')
-        plt.close(fig)
-        
-        # Загружаем изображение через OpenCV
-        img = cv2.imread(temp_filename, cv2.IMREAD_UNCHANGED)
-        
-        # Проверяем, что изображение загружено
-        if img is None:
-            print(f"❌ Не удалось загрузить временное изображение: {temp_filename}")
-            return
-        
-        # Конвертируем в HSV для лучшего выделения фиолетового
-        hsv = cv2.cvtColor(img, cv2.COLOR_BGR2HSV)
-        
-        # Определяем диапазон фиолетового/темно-синего цвета для Spectral_r
-        lower_purple = np.array([100, 30, 30])
-        upper_purple = np.array([160, 255, 255])
-        
-        # Создаем маску для фиолетового цвета
-        mask = cv2.inRange(hsv, lower_purple, upper_purple)
-        
-        # Инвертируем маску (делаем фиолетовые области прозрачными)
-        mask_inv = cv2.bitwise_not(mask)
-        
-        # Создаем 4-канальное изображение с альфа-каналом
-        img_rgba = cv2.cvtColor(img, cv2.COLOR_BGR2BGRA)
-        img_rgba[:, :, 3] = mask_inv  # Устанавливаем альфа-канал
-        
-        # Принудительно изменяем размер к точному 16:9 если нужно
-        target_height = 1080
-        target_width = 1920
-        if img_rgba.shape[:2] != (target_height, target_width):
-            img_rgba = cv2.resize(img_rgba, (target_width, target_height), interpolation=cv2.INTER_LANCZOS4)
-        
-        # Сохраняем результат
-        cv2.imwrite(filename, img_rgba)
-        
-        # Удаляем временный файл
-        os.remove(temp_filename)
-        
-        print(f"💾 Изображение 16:9 ({target_width}x{target_height}) сохранено: {filename}")
-        
-    except ImportError:
-        print("❌ OpenCV не установлен. Используйте: pip install opencv-python")
-    except Exception as e:
-        print(f"❌ Ошибка при обработке изображения: {e}")
+    """
+    Создает чистое изображение 16:9 с прозрачным фоном (прежнее имя функции).
+    Теперь без OpenCV и временного файла: делегирует create_clean_heatmap_png,
+    поэтому безопасна при параллельном пакетном анализе.
+    """
+    create_clean_heatmap_png(Z_kde, filename, width=1920, height=1080)
+    print(f"💾 Изображение 16:9 (1920x1080) сохранено: {filename}")
 
 
-def save_analysis_files(x, y, T, Tn, X, Y, Z, output_dir="data/analysis"):
+def save_analysis_files(x, y, T, Tn, X, Y, Z, output_dir="data/analysis", name=None):
     """ 
     Args:
         x, y: координаты точек
@@ -225,34 +366,468 @@ def save_analysis_files(x, y, T, Tn, X, Y, Z, output_dir="data/analysis"):
         X, Y: координатные сетки
         Z: матрица плотности KDE
         output_dir: папка для сохранения
+        name: название теста в именах файлов (различает сессии, обработанные в одну секунду)
     """
     os.makedirs(output_dir, exist_ok=True)
     
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    suffix = f"{name}_{timestamp}" if name else timestamp
     
     kde_matrix = pd.DataFrame(Z)
-    kde_matrix.to_csv(f"{output_dir}/kde_heatmap_{timestamp}.csv", index=False)
+    kde_matrix.to_csv(f"{output_dir}/kde_heatmap_{suffix}.csv", index=False)
     
-    np.savez(f"{output_dir}/coordinate_grids_{timestamp}.npz", X=X, Y=Y)
+    np.savez(f"{output_dir}/coordinate_grids_{suffix}.npz", X=X, Y=Y)
     
     
     print(f"📁 Результаты анализа сохранены в папку: {output_dir}")
     print(f"   Создано 3 файла с временной меткой: {timestamp}")
 
 
-def compute_kde(data, x_range, y_range, grid_size=100):
+def binned_kde(data, weights, covariance, x_grid, y_grid):
     """
-    Вычисляет KDE для координатных данных
+    Быстрая оценка KDE на регулярной сетке: точки раскладываются по узлам
+    сетки (линейное бинирование с весами), затем гистограмма сворачивается
+    с гауссовым ядром заданной ковариации через FFT.
+    Сложность O(N + G² log G) вместо O(N·G²) у прямого вычисления gaussian_kde.
+    
+    Args:
+        data: массив точек формы (2, N)
+        weights: веса точек (нормализуются на сумму)
+        covariance: ковариационная матрица ядра 2x2 (как kde.covariance)
+        x_grid, y_grid: узлы сетки по осям (равномерные)
+    
+    Returns:
+        Z: матрица плотности формы (len(y_grid), len(x_grid))
+    """
+    weights = np.asarray(weights, dtype=float)
+    rx, ry = kernel_radius(covariance, x_grid, y_grid)
+    counts = linear_binning(data[0], data[1], weights, x_grid, y_grid, rx, ry)
+    kernel = gaussian_kernel(covariance, x_grid, y_grid, rx, ry)
+    
+    Z = fftconvolve(counts, kernel, mode='valid') / np.sum(weights)
+    # FFT дает шум порядка 1e-17 вместо точных нулей
+    return np.clip(Z, 0, None)
+
+
+def tiled_binned_kde(data, weights, covariance, x_grid, y_grid, tile_size=512, workers=None):
+    """
+    binned_kde для больших сеток (например, в разрешении стимула).
+    
+    Свертка выполняется по плиткам tile_size x tile_size с перекрытием
+    на радиус ядра, поэтому буферы FFT ограничены размером плитки, а не
+    всей сетки. Плитки независимы и могут считаться в нескольких потоках.
+    
+    Args:
+        tile_size: сторона плитки в узлах сетки
+        workers: количество потоков (None или 1 - последовательно)
+    
+    Returns:
+        Z: матрица плотности формы (len(y_grid), len(x_grid)), float32
+    """
+    weights = np.asarray(weights, dtype=float)
+    rx, ry = kernel_radius(covariance, x_grid, y_grid)
+    counts = linear_binning(data[0], data[1], weights, x_grid, y_grid, rx, ry)
+    kernel = gaussian_kernel(covariance, x_grid, y_grid, rx, ry)
+    scale = 1.0 / np.sum(weights)
+    
+    height, width = len(y_grid), len(x_grid)
+    Z = np.empty((height, width), dtype=np.float32)
+    
+    def compute_tile(origin):
+        r0, c0 = origin
+        r1 = min(r0 + tile_size, height)
+        c1 = min(c0 + tile_size, width)
+        # Плитка результата зависит от окна сетки, расширенного на радиус ядра
+        window = counts[r0:r1 + 2 * ry, c0:c1 + 2 * rx]
+        tile = fftconvolve(window, kernel, mode='valid') * scale
+        Z[r0:r1, c0:c1] = np.clip(tile, 0, None)
+    
+    tiles = [(r0, c0) for r0 in range(0, height, tile_size) for c0 in range(0, width, tile_size)]
+    if workers and workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(compute_tile, tiles))
+    else:
+        for origin in tiles:
+            compute_tile(origin)
+    return Z
+
+
+def kernel_radius(covariance, x_grid, y_grid):
     """
-    x_grid = np.linspace(x_range[0], x_range[1], grid_size)
-    y_grid = np.linspace(y_range[0], y_range[1], grid_size)
-    X, Y = np.meshgrid(x_grid, y_grid)
-    positions = np.vstack([X.ravel(), Y.ravel()])
+    Радиус ядра в ячейках по осям (4 сигмы); сетка расширяется на радиус,
+    чтобы учесть точки за ее пределами
+    """
+    dx = x_grid[1] - x_grid[0]
+    dy = y_grid[1] - y_grid[0]
+    rx = int(min(np.ceil(4 * np.sqrt(covariance[0, 0]) / dx), 2 * len(x_grid)))
+    ry = int(min(np.ceil(4 * np.sqrt(covariance[1, 1]) / dy), 2 * len(y_grid)))
+    return rx, ry
+
+
+def linear_binning(x, y, weights, x_grid, y_grid, rx, ry):
+    """
+    Линейное бинирование: вес точки делится между 4 соседними узлами
+    сетки, расширенной на rx, ry ячеек с каждой стороны
     
-    kde = gaussian_kde(data, bw_method='scott')
-    Z = kde(positions).reshape(grid_size, grid_size)
+    Returns:
+        counts: матрица весов формы (len(y_grid) + 2*ry, len(x_grid) + 2*rx)
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    dx = x_grid[1] - x_grid[0]
+    dy = y_grid[1] - y_grid[0]
+    nx = len(x_grid) + 2 * rx
+    ny = len(y_grid) + 2 * ry
     
-    return X, Y, Z
+    fx = (x - x_grid[0]) / dx + rx
+    fy = (y - y_grid[0]) / dy + ry
+    inside = (fx >= 0) & (fx < nx - 1) & (fy >= 0) & (fy < ny - 1)
+    fx, fy, w = fx[inside], fy[inside], weights[inside]
+    ix = fx.astype(np.intp)
+    iy = fy.astype(np.intp)
+    tx = fx - ix
+    ty = fy - iy
+    index = iy * nx + ix
+    size = nx * ny
+    return (
+        np.bincount(index, w * (1 - tx) * (1 - ty), minlength=size)
+        + np.bincount(index + 1, w * tx * (1 - ty), minlength=size)
+        + np.bincount(index + nx, w * (1 - tx) * ty, minlength=size)
+        + np.bincount(index + nx + 1, w * tx * ty, minlength=size)
+    ).reshape(ny, nx)
+
+
+def gaussian_kernel(covariance, x_grid, y_grid, rx, ry):
+    """Гауссово ядро с ковариацией covariance на смещениях узлов сетки"""
+    dx = x_grid[1] - x_grid[0]
+    dy = y_grid[1] - y_grid[0]
+    offsets_x = np.arange(-rx, rx + 1) * dx
+    offsets_y = np.arange(-ry, ry + 1) * dy
+    KX, KY = np.meshgrid(offsets_x, offsets_y)
+    inv_cov = np.linalg.inv(covariance)
+    quad = inv_cov[0, 0] * KX ** 2 + 2 * inv_cov[0, 1] * KX * KY + inv_cov[1, 1] * KY ** 2
+    return np.exp(-0.5 * quad) / (2 * np.pi * np.sqrt(np.linalg.det(covariance)))
+
+
+class GazeAnalysisContext:
+    """
+    Общие данные анализа одной сессии: сетка, точки и посчитанные плотности.
+    
+    Сетка, массив точек и координаты узлов вычисляются один раз, а каждая
+    поверхность плотности (без весов, по T, по Tn) кешируется по ключу,
+    поэтому все графики и экспорты сессии используют одни и те же матрицы.
+    """
+    
+    # Множитель ширины окна для взвешенных карт (по T и Tn)
+    WEIGHTED_BANDWIDTH_FACTOR = 0.5
+    
+    def __init__(self, x, y, x_range, y_range, grid_size=100, method='fft', T=None, Tn=None):
+        """
+        Args:
+            x, y: координаты точек
+            x_range, y_range: диапазоны осей
+            grid_size: размер сетки
+            method: 'fft' - бинирование и свертка через FFT (быстро),
+                    'scipy' - прямое вычисление gaussian_kde в каждом узле
+            T, Tn: временные ряды для взвешенных карт (опционально)
+        """
+        if method not in ('fft', 'scipy'):
+            raise ValueError(f"Неизвестный метод KDE: {method}")
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.x_range = x_range
+        self.y_range = y_range
+        self.grid_size = grid_size
+        self.method = method
+        self.T = None if T is None else np.asarray(T)
+        self.Tn = None if Tn is None else np.asarray(Tn)
+        self._densities = {}
+    
+    @cached_property
+    def data(self):
+        return np.vstack([self.x, self.y])
+    
+    @cached_property
+    def x_grid(self):
+        return np.linspace(self.x_range[0], self.x_range[1], self.grid_size)
+    
+    @cached_property
+    def y_grid(self):
+        return np.linspace(self.y_range[0], self.y_range[1], self.grid_size)
+    
+    @cached_property
+    def grids(self):
+        """Координатные сетки (X, Y)"""
+        return np.meshgrid(self.x_grid, self.y_grid)
+    
+    @property
+    def X(self):
+        return self.grids[0]
+    
+    @property
+    def Y(self):
+        return self.grids[1]
+    
+    @cached_property
+    def positions(self):
+        """Узлы сетки в формате gaussian_kde (нужны только для method='scipy')"""
+        return np.vstack([self.X.ravel(), self.Y.ravel()])
+    
+    def density(self, key='points', weights=None, bandwidth_factor=1.0):
+        """
+        Матрица плотности KDE; повторный вызов с тем же ключом берет ее из кеша
+        
+        Args:
+            key: имя поверхности в кеше
+            weights: веса точек (None - без весов)
+            bandwidth_factor: множитель к ширине окна по Скотту
+        """
+        if key not in self._densities:
+            kde = self._kde(weights, bandwidth_factor)
+            if self.method == 'fft':
+                Z = binned_kde(kde.dataset, kde.weights, kde.covariance, self.x_grid, self.y_grid)
+            else:
+                Z = kde(self.positions).reshape(self.grid_size, self.grid_size)
+            self._densities[key] = Z
+        return self._densities[key]
+    
+    def _kde(self, weights=None, bandwidth_factor=1.0):
+        """gaussian_kde по точкам сессии с шириной окна по Скотту, умноженной на bandwidth_factor"""
+        kde = gaussian_kde(self.data, weights=weights, bw_method='scott')
+        if bandwidth_factor != 1.0:
+            kde.covariance_factor = lambda: bandwidth_factor * kde.scotts_factor()
+            kde._compute_covariance()
+        return kde
+    
+    def density_at_resolution(self, width, height, weights=None, bandwidth_factor=1.0,
+                              tile_size=512, workers=None, max_cells_per_sigma=4):
+        """
+        Плотность на сетке width x height (разрешение стимула) с той же
+        шириной окна, что и у матриц grid_size; считается по плиткам.
+        
+        Плотность не содержит деталей мельче ширины ядра, поэтому при
+        широком ядре она считается на сетке с max_cells_per_sigma узлами
+        на сигму и затем билинейно увеличивается до width x height.
+        
+        Args:
+            max_cells_per_sigma: предел узлов сетки на сигму ядра (None - всегда полное разрешение)
+        
+        Returns:
+            Z: матрица формы (height, width), float32
+        """
+        kde = self._kde(weights, bandwidth_factor)
+        grid_width, grid_height = width, height
+        if max_cells_per_sigma:
+            x_span = self.x_range[1] - self.x_range[0]
+            y_span = self.y_range[1] - self.y_range[0]
+            sigma_x, sigma_y = np.sqrt(np.diag(kde.covariance))
+            grid_width = min(width, int(np.ceil(x_span / sigma_x * max_cells_per_sigma)) + 1)
+            grid_height = min(height, int(np.ceil(y_span / sigma_y * max_cells_per_sigma)) + 1)
+        
+        x_grid = np.linspace(self.x_range[0], self.x_range[1], grid_width)
+        y_grid = np.linspace(self.y_range[0], self.y_range[1], grid_height)
+        Z = tiled_binned_kde(kde.dataset, kde.weights, kde.covariance, x_grid, y_grid,
+                             tile_size=tile_size, workers=workers)
+        if Z.shape != (height, width):
+            Z = resize_bilinear(Z, width, height).astype(np.float32)
+        return Z
+    
+    @property
+    def Z_kde(self):
+        """Плотность точек без весов"""
+        return self.density('points')
+    
+    @cached_property
+    def T_normalized(self):
+        """T, нормализованное в диапазон [0;1]"""
+        return _normalize_weights(self.T)
+    
+    @cached_property
+    def Tn_normalized(self):
+        """Tn, нормализованное в диапазон [0;1]"""
+        return _normalize_weights(self.Tn)
+    
+    @property
+    def Z_time(self):
+        """Плотность с весами раннего внимания (инвертированное T)"""
+        return self.density('time', 1.0 - self.T_normalized, self.WEIGHTED_BANDWIDTH_FACTOR)
+    
+    @property
+    def Z_duration(self):
+        """Плотность с весами длительности фиксаций (Tn)"""
+        return self.density('duration', self.Tn_normalized, self.WEIGHTED_BANDWIDTH_FACTOR)
+    
+    def params(self):
+        """Параметры, от которых зависят матрицы плотности (для ключа кеша)"""
+        return {
+            'x_range': list(self.x_range),
+            'y_range': list(self.y_range),
+            'grid_size': self.grid_size,
+            'method': self.method,
+            'bandwidth': 'scott',
+            'weighted_bandwidth_factor': self.WEIGHTED_BANDWIDTH_FACTOR,
+            'weights': {'time': '1 - T_normalized', 'duration': 'Tn_normalized'},
+        }
+    
+    def densities(self):
+        """Все поверхности плотности сессии {ключ: матрица}"""
+        surfaces = {'points': self.Z_kde}
+        if self.T is not None:
+            surfaces['time'] = self.Z_time
+        if self.Tn is not None:
+            surfaces['duration'] = self.Z_duration
+        return surfaces
+    
+    def restore_densities(self, densities):
+        """Подставляет ранее посчитанные матрицы вместо повторного вычисления"""
+        self._densities.update(densities)
+
+
+def _normalize_weights(values):
+    """Нормализует временной ряд в диапазон [0;1]"""
+    if len(np.unique(values)) > 1:
+        return (values - np.min(values)) / (np.max(values) - np.min(values))
+    return np.zeros_like(values)
+
+
+class AggregateHeatmap:
+    """
+    Сводная тепловая карта по многим сессиям (участникам) одного стимула.
+    
+    Вместо объединения всех точек в один gaussian_kde каждая сессия
+    раскладывается линейным бинированием на общую сетку, и веса
+    складываются. Плотность получается одной сверткой накопленной сетки
+    с гауссовым ядром фиксированной ширины, поэтому добавление участника
+    не требует пересчета остальных, а память зависит только от размера сетки.
+    """
+    
+    SURFACES = ('points', 'time', 'duration')
+    
+    def __init__(self, grid_size=100, bandwidth=0.03, normalize_sessions=True,
+                 x_range=(0, 1), y_range=(0, 1)):
+        """
+        Args:
+            grid_size: размер сетки
+            bandwidth: ширина ядра (сигма) в единицах координат, одна для всех сессий
+            normalize_sessions: каждая сессия вносит одинаковый вклад независимо
+                                от числа фиксаций
+            x_range, y_range: диапазоны осей
+        """
+        self.grid_size = grid_size
+        self.bandwidth = bandwidth
+        self.normalize_sessions = normalize_sessions
+        self.x_range = tuple(x_range)
+        self.y_range = tuple(y_range)
+        self.x_grid = np.linspace(x_range[0], x_range[1], grid_size)
+        self.y_grid = np.linspace(y_range[0], y_range[1], grid_size)
+        self.covariance = np.eye(2) * bandwidth ** 2
+        self.rx, self.ry = kernel_radius(self.covariance, self.x_grid, self.y_grid)
+        
+        shape = (grid_size + 2 * self.ry, grid_size + 2 * self.rx)
+        self.counts = {key: np.zeros(shape) for key in self.SURFACES}
+        self.totals = dict.fromkeys(self.SURFACES, 0.0)
+        self.sessions = {}  # имя сессии -> количество точек
+    
+    def __len__(self):
+        return len(self.sessions)
+    
+    def add_session(self, name, x, y, T=None, Tn=None):
+        """
+        Добавляет сессию в сводную карту (повторное добавление пропускается)
+        
+        Returns:
+            bool: True, если сессия добавлена
+        """
+        if name in self.sessions or len(x) == 0:
+            return False
+        weights = {'points': np.ones(len(x))}
+        if T is not None:
+            weights['time'] = 1.0 - _normalize_weights(np.asarray(T))
+        if Tn is not None:
+            weights['duration'] = _normalize_weights(np.asarray(Tn))
+        
+        for key, w in weights.items():
+            total = np.sum(w)
+            if total <= 0:
+                continue
+            if self.normalize_sessions:
+                w = w / total
+                total = 1.0
+            self.counts[key] += linear_binning(x, y, w, self.x_grid, self.y_grid, self.rx, self.ry)
+            self.totals[key] += total
+        self.sessions[name] = len(x)
+        return True
+    
+    def add_file(self, filename, boundaries=None):
+        """Загружает запись трекера, нормализует по границам калибровки и добавляет ее"""
+        name = os.path.basename(filename)
+        if name in self.sessions:
+            return False
+        x, y, T, Tn = load_gaze_data(filename)
+        if x is None:
+            return False
+        if boundaries is not None:
+            x, y, T, Tn = filter_and_normalize_gaze_data(x, y, T, Tn, boundaries)
+        return self.add_session(name, x, y, T, Tn)
+    
+    def density(self, key='points'):
+        """Сводная матрица плотности по всем добавленным сессиям"""
+        if self.totals[key] == 0:
+            return np.zeros((self.grid_size, self.grid_size))
+        kernel = gaussian_kernel(self.covariance, self.x_grid, self.y_grid, self.rx, self.ry)
+        Z = fftconvolve(self.counts[key], kernel, mode='valid') / self.totals[key]
+        return np.clip(Z, 0, None)
+    
+    @property
+    def Z_kde(self):
+        return self.density('points')
+    
+    @property
+    def Z_time(self):
+        return self.density('time')
+    
+    @property
+    def Z_duration(self):
+        return self.density('duration')
+    
+    def save(self, filename):
+        """Сохраняет накопленное состояние в .npz"""
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        settings = {
+            'grid_size': self.grid_size,
+            'bandwidth': self.bandwidth,
+            'normalize_sessions': self.normalize_sessions,
+            'x_range': list(self.x_range),
+            'y_range': list(self.y_range),
+            'totals': self.totals,
+            'sessions': self.sessions,
+        }
+        np.savez(filename, settings=np.array(json.dumps(settings, ensure_ascii=False)),
+                 **{f"counts_{key}": counts for key, counts in self.counts.items()})
+    
+    @classmethod
+    def load(cls, filename):
+        """Восстанавливает состояние, сохраненное методом save()"""
+        with np.load(filename) as state:
+            settings = json.loads(str(state['settings']))
+            aggregate = cls(settings['grid_size'], settings['bandwidth'], settings['normalize_sessions'],
+                            settings['x_range'], settings['y_range'])
+            for key in cls.SURFACES:
+                aggregate.counts[key] = state[f"counts_{key}"]
+        aggregate.totals.update(settings['totals'])
+        aggregate.sessions = settings['sessions']
+        return aggregate
+
+
+def compute_kde(data, x_range, y_range, grid_size=100, method='fft'):
+    """
+    Вычисляет KDE для координатных данных
+    
+    Args:
+        method: 'fft' - бинирование и свертка через FFT (быстро),
+                'scipy' - прямое вычисление gaussian_kde в каждом узле
+    """
+    context = GazeAnalysisContext(data[0], data[1], x_range, y_range, grid_size, method)
+    return context.X, context.Y, context.Z_kde
 
 
 def plot_scatter_time(x, y, time_values, title_suffix, ax):
@@ -281,7 +856,7 @@ def plot_contour_time(X, Y, Z, title_suffix, ax):
     ax.set_ylabel('Y координата', fontsize=12)
 
 
-def create_weighted_kde_heatmap(x, y, weights, x_range, y_range, grid_size=100):
+def create_weighted_kde_heatmap(x, y, weights, x_range, y_range, grid_size=100, method='fft'):
     """
     Создает тепловую карту используя Gaussian KDE с весами
     
@@ -290,62 +865,19 @@ def create_weighted_kde_heatmap(x, y, weights, x_range, y_range, grid_size=100):
         weights: веса для каждой точки (нормализованы [0;1])
         x_range, y_range: диапазоны осей
         grid_size: размер сетки
+        method: 'fft' (бинирование + FFT-свертка) или 'scipy' (прямое вычисление)
     """
-    # Создаем сетку
-    x_grid = np.linspace(x_range[0], x_range[1], grid_size)
-    y_grid = np.linspace(y_range[0], y_range[1], grid_size)
-    X, Y = np.meshgrid(x_grid, y_grid)
-    positions = np.vstack([X.ravel(), Y.ravel()])
-    
-    data = np.vstack([x, y])
-    
-    kde = gaussian_kde(data, weights=weights, bw_method='scott')
-    kde.covariance_factor = lambda: 0.5 * kde.scotts_factor()
-    kde._compute_covariance()
-    
-    Z = kde(positions).reshape(grid_size, grid_size)
-    
-    return X, Y, Z
-
+    context = GazeAnalysisContext(x, y, x_range, y_range, grid_size, method)
+    Z = context.density('weighted', weights, bandwidth_factor=0.5)
+    return context.X, context.Y, Z
 
-def create_gaze_heatmap(csv_filename=None, use_calibration=True):
-    setup_theme()
-    
-    if csv_filename is None:
-        csv_filename = find_latest_gaze_file()
-        if csv_filename is None:
-            print("❌ Не найдено файлов с данными трекера (gaze_data_*.csv)")
-            print("   Проверьте папки: data/raw/ и корневую папку")
-            return
-        print(f"📁 Автоматически выбран файл: {csv_filename}")
-    
-    x, y, T, Tn = load_gaze_data(csv_filename)
-    if x is None:
-        return
-    
-    # Извлекаем границы из калибровки и нормализуем данные
-    if use_calibration:
-        boundaries = extract_boundaries_from_calibration()
-        x, y, T, Tn = filter_and_normalize_gaze_data(x, y, T, Tn, boundaries)
-        # Для нормализованных данных диапазон всегда [0, 1]
-        x_range = (0, 1)
-        y_range = (0, 1)
-    else:
-        # Определяем диапазоны с отступом
-        x_range = (float(np.min(x)) - 0.05, float(np.max(x)) + 0.05) # type: ignore
-        y_range = (float(np.min(y)) - 0.05, float(np.max(y)) + 0.05) # type: ignore
-    
-    # Нормализуем временные данные в диапазон [0;1]
-    T_normalized = (T - np.min(T)) / (np.max(T) - np.min(T)) if len(np.unique(T)) > 1 else np.zeros_like(T) # type: ignore
-    Tn_normalized = (Tn - np.min(Tn)) / (np.max(Tn) - np.min(Tn)) if len(np.unique(Tn)) > 1 else np.zeros_like(Tn) # type: ignore
-    
-    
 
-    data = np.vstack([x, y]) # type: ignore
-    X, Y, Z_kde = compute_kde(data, x_range, y_range)
-    
-    X_time, Y_time, Z_time = create_weighted_kde_heatmap(x, y, 1.0 - T_normalized, x_range, y_range)  # Инвертируем T
-    X_duration, Y_duration, Z_duration = create_weighted_kde_heatmap(x, y, Tn_normalized, x_range, y_range)
+def plot_session_figures(context, x, y, T, Tn, use_calibration=True):
+    """Окна анализа сессии: время до первой фиксации, длительность фиксаций и общая карта"""
+    X, Y, Z_kde = context.X, context.Y, context.Z_kde
+    x_range, y_range = context.x_range, context.y_range
+    Z_time = context.Z_time  # Инвертированное T: раннее внимание
+    Z_duration = context.Z_duration
     
     fig1, axes1 = plt.subplots(1, 3, figsize=(18, 6))
     fig1.suptitle('Анализ времени до первой фиксации (T)\nКрасный = раннее внимание, Синий = позднее внимание', 
@@ -401,31 +933,121 @@ def create_gaze_heatmap(csv_filename=None, use_calibration=True):
         plt.xlabel('X координата', fontsize=12)
         plt.ylabel('Y координата', fontsize=12)
     plt.tight_layout()
+
+
+def create_gaze_heatmap(csv_filename=None, use_calibration=True, method='fft', show=True, cache=True,
+                        boundaries=None, resolution=(1920, 1080), pyramid=False, tile_workers=None):
+    """
+    Строит тепловые карты сессии и сохраняет изображение и матрицы анализа.
+    
+    Если файл, границы калибровки и параметры анализа не изменились
+    с прошлого запуска, матрицы плотности берутся из кеша, файлы анализа
+    не создаются заново, а без show=True сессия пропускается целиком.
+    
+    Args:
+        show: показать окна графиков (False - окна не строятся, для пакетной обработки)
+        cache: использовать кеш результатов (True - data/analysis/cache, либо экземпляр AnalysisCache)
+        boundaries: готовые границы калибровки (по умолчанию читаются из data/raw)
+        resolution: разрешение стимула (ширина, высота) для чистого изображения; плотность
+                    считается в этом разрешении по плиткам (None - увеличение матрицы grid_size)
+        pyramid: дополнительно сохранить уменьшенные уровни пирамиды <тест>_<ширина>x<высота>.png
+                 (уровень 0 - сам <тест>.png)
+        tile_workers: количество потоков для расчета плиток
+    
+    Returns:
+        GazeAnalysisContext: сетка и плотности сессии или None, если данных нет
+    """
+    setup_theme()
+    
+    if csv_filename is None:
+        csv_filename = find_latest_gaze_file()
+        if csv_filename is None:
+            print("❌ Не найдено файлов с данными трекера (gaze_data_*.csv, gaze_data_*.npy)")
+            print("   Проверьте папки: data/raw/ и корневую папку")
+            return
+        print(f"📁 Автоматически выбран файл: {csv_filename}")
+    
+    x, y, T, Tn = load_gaze_data(csv_filename)
+    if x is None:
+        return
+    
+    # Извлекаем границы из калибровки и нормализуем данные
+    if use_calibration:
+        if boundaries is None:
+            boundaries = extract_boundaries_from_calibration()
+        x, y, T, Tn = filter_and_normalize_gaze_data(x, y, T, Tn, boundaries)
+        # Для нормализованных данных диапазон всегда [0, 1]
+        x_range = (0, 1)
+        y_range = (0, 1)
+    else:
+        boundaries = None
+        # Определяем диапазоны с отступом
+        x_range = (float(np.min(x)) - 0.05, float(np.max(x)) + 0.05) # type: ignore
+        y_range = (float(np.min(y)) - 0.05, float(np.max(y)) + 0.05) # type: ignore
+    
+    # Общая сетка и плотности сессии считаются один раз для всех графиков и экспортов
+    context = GazeAnalysisContext(x, y, x_range, y_range, method=method, T=T, Tn=Tn)
     
     # Извлекаем название теста из имени файла
     import re
     test_name = "unknown"
     if csv_filename:
-        match = re.search(r'gaze_data_(.+?)\.csv', csv_filename)
+        match = re.search(r'gaze_data_(.+?)\.(?:csv|npy)', csv_filename)
         if match:
             test_name = match.group(1)
-    
-    # Создаем только OpenCV версию с названием теста
     output_filename = f"{test_name}.png"
-    create_clean_heatmap_opencv(Z_kde, x_range, y_range, output_filename)
     
-    save_analysis_files(x, y, T, Tn, X, Y, Z_kde)
+    analysis_cache = AnalysisCache() if cache is True else (cache or None)
+    cached = None
+    if analysis_cache is not None:
+        cache_key = analysis_cache.make_key(csv_filename, boundaries, context.params())
+        cached = analysis_cache.get(cache_key)
+        if cached is not None:
+            context.restore_densities(cached)
+            # Настройки отрисовки не входят в ключ кеша: пропускаем сессию, только если
+            # изображения для текущих resolution и pyramid уже сохранены
+            if not show and heatmap_outputs_exist(heatmap_output_files(test_name, resolution, pyramid)):
+                print(f"⏭️  Сессия не изменилась, результаты в кеше: {csv_filename}")
+                return context
+        else:
+            analysis_cache.put(cache_key, context.densities())
     
-    plt.show()
+    X, Y, Z_kde = context.X, context.Y, context.Z_kde
+    
+    if cached is None or not heatmap_outputs_exist(heatmap_output_files(test_name, resolution, pyramid)):
+        # Создаем изображение 16:9 с названием теста
+        if resolution:
+            width, height = resolution
+            Z_native = context.density_at_resolution(width, height, workers=tile_workers)
+            create_clean_heatmap_png(Z_native, output_filename, width, height)
+            if pyramid:
+                levels = save_heatmap_pyramid(Z_native, test_name)
+                print(f"💾 Пирамида тепловой карты: {', '.join([output_filename] + levels)}")
+        else:
+            width, height = 1920, 1080
+            create_clean_heatmap_png(Z_kde, output_filename, width, height)
+        print(f"💾 Изображение ({width}x{height}) сохранено: {output_filename}")
+    
+    if cached is None:
+        save_analysis_files(x, y, T, Tn, X, Y, Z_kde, name=test_name)
+    else:
+        print("📁 Матрицы анализа взяты из кеша, новые файлы не создаются")
+    
+    if show:
+        # Окна графиков строятся только для просмотра: в пакетном режиме (show=False)
+        # считаются плотности и сохраняются файлы
+        plot_session_figures(context, x, y, T, Tn, use_calibration)
+        plt.show()
     
     print("✅ Анализ завершен!")
     print(f"📊 Проанализировано {len(x)} точек фиксации")
+    return context
 
 
 def analyze_all_gaze_files():
     """Анализирует все найденные файлы с данными трекера"""
     # Ищем файлы в обеих локациях
-    gaze_files = glob.glob("data/raw/gaze_data_*.csv") + glob.glob("gaze_data_*.csv")
+    gaze_files = find_gaze_files(include_root=True)
     
     if not gaze_files:
         print("❌ Не найдено файлов с данными трекера")
@@ -437,8 +1059,12 @@ def analyze_all_gaze_files():
         file_time = datetime.fromtimestamp(os.path.getctime(file))
         print(f"   {i}. {file} (создан: {file_time.strftime('%Y-%m-%d %H:%M:%S')})")
     
-    choice = input(f"\nВыберите файл для анализа (1-{len(gaze_files)}) или нажмите Enter для последнего: ").strip()
+    choice = input(f"\nВыберите файл для анализа (1-{len(gaze_files)}), 'all' для анализа всех файлов "
+                   f"или нажмите Enter для последнего: ").strip()
     
+    if choice.lower() in ("all", "все"):
+        analyze_gaze_files_batch(gaze_files)
+        return
     if choice == "":
         # Берем последний файл
         selected_file = max(gaze_files, key=os.path.getctime)
@@ -458,13 +1084,130 @@ def analyze_all_gaze_files():
     create_gaze_heatmap(selected_file)
 
 
+def create_aggregate_heatmap(gaze_files=None, name="all", use_calibration=True,
+                             output_dir="data/analysis", **aggregate_options):
+    """
+    Обновляет сводную тепловую карту стимула по сессиям участников.
+    
+    Состояние хранится в data/analysis/aggregate_<name>.npz: при повторном
+    запуске добавляются только новые сессии, уже учтенные не пересчитываются.
+    
+    Args:
+        gaze_files: файлы сессий (по умолчанию - все найденные записи)
+        name: название стимула в именах файлов
+        aggregate_options: параметры AggregateHeatmap для новой сводной карты
+    
+    Returns:
+        AggregateHeatmap: сводная карта
+    """
+    if gaze_files is None:
+        gaze_files = find_gaze_files(include_root=True)
+    
+    state_file = os.path.join(output_dir, f"aggregate_{name}.npz")
+    if os.path.exists(state_file):
+        aggregate = AggregateHeatmap.load(state_file)
+        print(f"📂 Загружена сводная карта: {len(aggregate)} сессий")
+    else:
+        aggregate = AggregateHeatmap(**aggregate_options)
+    
+    boundaries = extract_boundaries_from_calibration() if use_calibration else None
+    added = sum(aggregate.add_file(file, boundaries) for file in sorted(gaze_files))
+    if added:
+        aggregate.save(state_file)
+    
+    output_filename = os.path.join(output_dir, f"aggregate_{name}.png")
+    if added or not os.path.exists(output_filename):
+        create_clean_heatmap_png(aggregate.Z_kde, output_filename)
+    
+    print(f"📊 Сводная карта '{name}': добавлено {added}, всего сессий {len(aggregate)}")
+    print(f"💾 Изображение сохранено: {output_filename}")
+    return aggregate
+
+
+def _init_batch_worker():
+    """Инициализация процесса пакетного анализа: рисование без окон"""
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def _analyze_file_worker(csv_filename, use_calibration, method, boundaries):
+    """Анализ одного файла в процессе пула, возвращает (файл, точек, ошибка, секунд)"""
+    start = time.perf_counter()
+    try:
+        context = create_gaze_heatmap(csv_filename, use_calibration, method, show=False,
+                                      boundaries=boundaries)
+    except Exception as e:
+        return csv_filename, 0, str(e), time.perf_counter() - start
+    if context is None:
+        return csv_filename, 0, "нет данных для анализа", time.perf_counter() - start
+    return csv_filename, len(context.x), None, time.perf_counter() - start
+
+
+def analyze_gaze_files_batch(gaze_files=None, workers=None, use_calibration=True, method='fft'):
+    """
+    Пакетный анализ нескольких сессий в пуле процессов.
+    
+    Каждый файл обрабатывается в отдельном процессе с бэкендом Agg
+    (без окон), поэтому KDE и отрисовка разных сессий идут параллельно
+    на всех ядрах.
+    
+    Args:
+        gaze_files: список файлов (по умолчанию - все найденные записи)
+        workers: количество процессов (по умолчанию - число ядер)
+        use_calibration: нормализовать данные по файлам калибровки
+        method: метод KDE ('fft' или 'scipy')
+    
+    Returns:
+        dict: {'succeeded': [(файл, точек)], 'failed': [(файл, ошибка)], 'elapsed': секунд}
+    """
+    if gaze_files is None:
+        gaze_files = find_gaze_files(include_root=True)
+    if not gaze_files:
+        print("❌ Не найдено файлов с данными трекера")
+        return {'succeeded': [], 'failed': [], 'elapsed': 0.0}
+    
+    workers = min(workers or os.cpu_count() or 1, len(gaze_files))
+    print(f"🚀 Пакетный анализ {len(gaze_files)} файлов в {workers} процессах")
+    
+    # Границы калибровки одни на весь пакет
+    boundaries = extract_boundaries_from_calibration() if use_calibration else None
+    
+    succeeded, failed = [], []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker) as executor:
+        futures = [executor.submit(_analyze_file_worker, file, use_calibration, method, boundaries)
+                   for file in gaze_files]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                file, points, error, seconds = future.result()
+            except Exception as e:
+                # Процесс пула завершился аварийно
+                failed.append(("?", str(e)))
+                print(f"❌ [{done}/{len(futures)}] Ошибка процесса анализа: {e}")
+                continue
+            if error is None:
+                succeeded.append((file, points))
+                print(f"✅ [{done}/{len(futures)}] {file}: {points} точек за {seconds:.1f} с")
+            else:
+                failed.append((file, error))
+                print(f"❌ [{done}/{len(futures)}] {file}: {error}")
+    elapsed = time.perf_counter() - start
+    
+    print("=" * 50)
+    print(f"📊 Успешно: {len(succeeded)}, с ошибками: {len(failed)}")
+    print(f"⏱️  {elapsed:.1f} с, {len(gaze_files) / elapsed:.2f} файлов/с")
+    for file, error in failed:
+        print(f"   ❌ {file}: {error}")
+    return {'succeeded': succeeded, 'failed': failed, 'elapsed': elapsed}
+
+
 def main():
     """Функция main для запуска анализатора"""
     print("🎯 Анализатор тепловых карт")
     print("=" * 50)
     
     # Проверяем наличие файлов с данными
-    gaze_files = glob.glob("data/raw/gaze_data_*.csv") + glob.glob("gaze_data_*.csv")
+    gaze_files = find_gaze_files(include_root=True)
     
     if not gaze_files:
         print("❌ Не найдено файлов с данными трекера (gaze_data_*.csv)")
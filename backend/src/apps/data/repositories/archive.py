@@ -0,0 +1,111 @@
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+
+# Размер блока чтения файлов: архив отдается частями, память не зависит от объема экспорта
+ARCHIVE_CHUNK_SIZE = 256 * 1024
+
+# Уже сжатые форматы записываются в ZIP без повторного сжатия
+STORED_EXTENSIONS = ('.png',)
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Буфер для записи архива без перемотки: накопленные байты забираются методом pop"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # ZipFile использует позицию для смещений записей в центральном каталоге
+        return self._position
+
+    def pop(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _flush(buffer: _StreamBuffer) -> Iterator[bytes]:
+    data = buffer.pop()
+    if data:
+        yield data
+
+
+def _read_chunks(source, size: int) -> Iterator[bytes]:
+    """Читает ровно size байт (файл мог измениться после открытия)"""
+    remaining = size
+    while remaining > 0:
+        chunk = source.read(min(ARCHIVE_CHUNK_SIZE, remaining))
+        if not chunk:
+            # Файл укоротился: дополняем нулями, чтобы не нарушить структуру архива
+            chunk = b'\0' * min(ARCHIVE_CHUNK_SIZE, remaining)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def iter_zip(files: Iterable[Tuple[Path, str]]) -> Iterator[bytes]:
+    """
+    Формирует ZIP архив по мере отдачи: (путь, имя в архиве) -> части архива.
+    Файлы, удаленные во время экспорта, пропускаются.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for file_path, arcname in files:
+            try:
+                source = open(file_path, 'rb')
+            except FileNotFoundError:
+                continue
+            with source:
+                stat_result = os.fstat(source.fileno())
+                info = zipfile.ZipInfo(arcname, date_time=time.localtime(stat_result.st_mtime)[:6])
+                info.file_size = stat_result.st_size
+                info.compress_type = (zipfile.ZIP_STORED if file_path.suffix.lower() in STORED_EXTENSIONS
+                                      else zipfile.ZIP_DEFLATED)
+                with archive.open(info, 'w') as target:
+                    for chunk in _read_chunks(source, stat_result.st_size):
+                        target.write(chunk)
+                        yield from _flush(buffer)
+            # Дескриптор данных записи
+            yield from _flush(buffer)
+    # Центральный каталог записывается при закрытии архива
+    yield from _flush(buffer)
+
+
+def iter_tar(files: Iterable[Tuple[Path, str]]) -> Iterator[bytes]:
+    """
+    Формирует TAR архив по мере отдачи: (путь, имя в архиве) -> части архива.
+    Заголовки и выравнивание записываются вручную, потому что TarFile.addfile
+    копирует файл целиком за один вызов.
+    """
+    for file_path, arcname in files:
+        try:
+            source = open(file_path, 'rb')
+        except FileNotFoundError:
+            continue
+        with source:
+            stat_result = os.fstat(source.fileno())
+            info = tarfile.TarInfo(arcname)
+            info.size = stat_result.st_size
+            info.mtime = int(stat_result.st_mtime)
+            info.mode = 0o644
+            yield info.tobuf(format=tarfile.PAX_FORMAT)
+            yield from _read_chunks(source, stat_result.st_size)
+            padding = -stat_result.st_size % tarfile.BLOCKSIZE
+            if padding:
+                yield b'\0' * padding
+    # Конец архива: два пустых блока
+    yield b'\0' * (2 * tarfile.BLOCKSIZE)
@@ -1,12 +1,19 @@
-from typing import Protocol, Optional, List
+from typing import BinaryIO, Callable, Iterator, Protocol, Optional, List, Tuple
 import os
 import asyncio
-import csv
-import statistics
+import hashlib
+import uuid
 from pathlib import Path
 from fastapi import UploadFile, HTTPException
-from ..schemas.data import DataFileSchema, FileType, HeatmapStatsSchema, HeatmapFirstStatsSchema, HeatmapLongStatsSchema, HeatmapPointSchema, FileListSchema
+from ..schemas.data import ArchiveFormat, DataFileSchema, FileType, HeatmapStatsSchema, HeatmapFirstStatsSchema, HeatmapLongStatsSchema, FileListSchema
 from datetime import datetime
+from .archive import iter_tar, iter_zip
+from .file_index import IndexedFile, get_file_index
+from .stats import STATS_FUNCTIONS, compute_heatmap_first_stats, compute_heatmap_long_stats, compute_heatmap_stats, stats_cache
+
+# Загрузка пишется на диск частями: память на загрузку не зависит от размера файла
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
 
 class DataRepositoryProtocol(Protocol):
     async def save_data_file(self, file: UploadFile, test_token: str, stage_id: int, test_name: str) -> DataFileSchema:
@@ -29,6 +36,19 @@ class DataRepositoryProtocol(Protocol):
         """Получает содержимое файла"""
         ...
     
+    async def get_file_path(self, test_token: str, stage_id: int, file_type: FileType) -> Tuple[Path, os.stat_result]:
+        """Получает путь к файлу и его актуальный stat (без чтения содержимого)"""
+        ...
+    
+    async def get_export_files(self, test_token: str, file_type: Optional[FileType] = None,
+                               stage_from: Optional[int] = None, stage_to: Optional[int] = None) -> List[IndexedFile]:
+        """Получает файлы теста (CSV и PNG) для экспорта с фильтрацией по типу и диапазону этапов"""
+        ...
+    
+    def iter_archive(self, files: List[IndexedFile], archive_format: ArchiveFormat) -> Iterator[bytes]:
+        """Формирует архив файлов по частям"""
+        ...
+    
     async def get_heatmap_stats(self, test_token: str, stage_id: int) -> HeatmapStatsSchema:
         """Вычисляет агрегированную статистику по тепловой карте"""
         ...
@@ -40,12 +60,35 @@ class DataRepositoryProtocol(Protocol):
     async def get_heatmap_long_stats(self, test_token: str, stage_id: int) -> HeatmapLongStatsSchema:
         """Вычисляет статистику по длительности фиксаций"""
         ...
+    
+    async def precompute_stats(self, test_token: str, stage_id: int, file_type: FileType) -> None:
+        """Заранее вычисляет статистику загруженного файла и сохраняет сводку"""
+        ...
 
 class DataRepositoryImpl:
-    def __init__(self, base_data_dir: str = "data"):
+    def __init__(self, base_data_dir: str = "data", max_upload_size: int = MAX_UPLOAD_SIZE,
+                 upload_chunk_size: int = UPLOAD_CHUNK_SIZE):
         self.base_data_dir = Path(base_data_dir)
+        self.max_upload_size = max_upload_size
+        self.upload_chunk_size = upload_chunk_size
         # Создаем базовую директорию если её нет
         self.base_data_dir.mkdir(exist_ok=True)
+        # Общий индекс файлов вместо обхода каталога на каждый запрос
+        self.file_index = get_file_index(self.base_data_dir)
+    
+    async def _get_index(self):
+        """Индекс файлов (при первом обращении строится в отдельном потоке)"""
+        if not self.file_index.built:
+            await asyncio.to_thread(self.file_index.ensure_built)
+        return self.file_index
+    
+    async def _find_file(self, test_token: str, stage_id: int, file_type: FileType) -> IndexedFile:
+        """Находит файл этапа (CSV, затем PNG) или возвращает 404"""
+        index = await self._get_index()
+        indexed = index.get(test_token, stage_id, file_type.value)
+        if indexed is None:
+            raise HTTPException(status_code=404, detail=f"Файл {file_type.value}_{stage_id} не найден")
+        return indexed
     
     def _get_test_directory(self, test_name: str, test_token: str) -> Path:
         """Получает директорию для теста"""
@@ -68,14 +111,14 @@ class DataRepositoryImpl:
         if not file.filename:
             raise HTTPException(status_code=400, detail="Имя файла не указано")
         
-        file_path = self._get_file_path(test_name, test_token, file.filename)
+        if file.size is not None and file.size > self.max_upload_size:
+            raise self._too_large()
         
-        # Читаем и сохраняем файл
-        content = await file.read()
-        file_size = len(content)
+        file_path = self._get_file_path(test_name, test_token, file.filename)
+        file_size, checksum = await self._write_upload(file, file_path)
         
-        # Записываем файл асинхронно
-        await asyncio.to_thread(file_path.write_bytes, content)
+        index = await self._get_index()
+        await asyncio.to_thread(index.add, file_path, file_path.parent.name.rsplit('_', 1)[0])
         
         return DataFileSchema(
             filename=file_path.name,
@@ -84,9 +127,44 @@ class DataRepositoryImpl:
             stage_id=stage_id,
             test_name=test_name,
             upload_time=datetime.now(),
-            file_size=file_size
+            file_size=file_size,
+            checksum=checksum
         )
     
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Размер файла превышает {self.max_upload_size} байт")
+    
+    @staticmethod
+    def _write_chunk(target: BinaryIO, digest, chunk: bytes) -> None:
+        digest.update(chunk)
+        target.write(chunk)
+    
+    async def _write_upload(self, file: UploadFile, file_path: Path) -> Tuple[int, str]:
+        """
+        Пишет загрузку во временный файл частями по upload_chunk_size с подсчетом
+        SHA-256 и атомарно переименовывает его в file_path.
+        Читатели не видят недописанный файл; при ошибке временный файл удаляется.
+        """
+        # Имя временного файла не разбирается индексом как файл этапа
+        temp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}.part")
+        digest = hashlib.sha256()
+        file_size = 0
+        target = await asyncio.to_thread(open, temp_path, 'wb')
+        try:
+            try:
+                while chunk := await file.read(self.upload_chunk_size):
+                    file_size += len(chunk)
+                    if file_size > self.max_upload_size:
+                        raise self._too_large()
+                    await asyncio.to_thread(self._write_chunk, target, digest, chunk)
+            finally:
+                await asyncio.to_thread(target.close)
+            await asyncio.to_thread(os.replace, temp_path, file_path)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+        return file_size, digest.hexdigest()
+    
     async def get_file_info(self, test_token: str, stage_id: int) -> Optional[DataFileSchema]:
         """Получает информацию о файле (упрощенная версия)"""
         # В реальности здесь был бы поиск в БД по метаданным
@@ -95,64 +173,24 @@ class DataRepositoryImpl:
     
     async def file_exists(self, test_token: str, stage_id: int) -> bool:
         """Проверяет существование файла"""
-        # Проверяем все возможные папки с данным токеном
-        pattern = f"*_{test_token[:8]}"
-        for test_dir in self.base_data_dir.glob(pattern):
-            if test_dir.is_dir():
-                file_path = test_dir / f"heatmap_{stage_id}.csv"
-                if file_path.exists():
-                    return True
-        return False
+        index = await self._get_index()
+        return index.get(test_token, stage_id, FileType.HEATMAP.value, extensions=('.csv',)) is not None
     
     async def get_files_list(self, test_token: str, file_type: Optional[FileType] = None, stage_id: Optional[int] = None) -> FileListSchema:
         """Получает список файлов с фильтрацией"""
-        files = []
-        
-        # Ищем директории тестов по токену
-        pattern = f"*_{test_token[:8]}"
-        for test_dir in self.base_data_dir.glob(pattern):
-            if not test_dir.is_dir():
-                continue
-                
-            # Получаем имя теста из названия директории
-            test_name = test_dir.name.rsplit('_', 1)[0]
-            
-            # Ищем файлы в директории
-            for file_path in test_dir.glob("*.csv"):
-                # Парсим имя файла: heatmap_1.csv, heatmap_first_1.csv, heatmap_long_1.csv, saccades_1.csv
-                name_parts = file_path.stem.split('_')
-                if len(name_parts) < 2:
-                    continue
-                
-                # Последняя часть всегда stage_id
-                stage_str = name_parts[-1]
-                try:
-                    current_stage_id = int(stage_str)
-                except ValueError:
-                    continue
-                
-                # Все части кроме последней составляют тип файла
-                current_file_type = '_'.join(name_parts[:-1])
-                
-                # Применяем фильтры
-                if file_type and current_file_type != file_type.value:
-                    continue
-                if stage_id and current_stage_id != stage_id:
-                    continue
-                
-                # Получаем размер файла
-                file_size = file_path.stat().st_size
-                upload_time = datetime.fromtimestamp(file_path.stat().st_mtime)
-                
-                files.append(DataFileSchema(
-                    filename=file_path.name,
-                    file_path=str(file_path),
-                    test_token=test_token,
-                    stage_id=current_stage_id,
-                    test_name=test_name,
-                    upload_time=upload_time,
-                    file_size=file_size
-                ))
+        index = await self._get_index()
+        files = [
+            DataFileSchema(
+                filename=indexed.path.name,
+                file_path=str(indexed.path),
+                test_token=test_token,
+                stage_id=indexed.stage_id,
+                test_name=indexed.test_name,
+                upload_time=indexed.upload_time,
+                file_size=indexed.size
+            )
+            for indexed in index.list_files(test_token, file_type.value if file_type else None, stage_id)
+        ]
         
         return FileListSchema(
             files=files,
@@ -161,214 +199,78 @@ class DataRepositoryImpl:
     
     async def get_file_content(self, test_token: str, stage_id: int, file_type: FileType) -> bytes:
         """Получает содержимое файла"""
-        # Ищем файл
-        pattern = f"*_{test_token[:8]}"
-        for test_dir in self.base_data_dir.glob(pattern):
-            if test_dir.is_dir():
-                file_path = test_dir / f"{file_type.value}_{stage_id}.csv"
-                if file_path.exists():
-                    return await asyncio.to_thread(file_path.read_bytes)
-                
-                # Также проверим .png файлы
-                png_path = test_dir / f"{file_type.value}_{stage_id}.png"
-                if png_path.exists():
-                    return await asyncio.to_thread(png_path.read_bytes)
-        
-        raise HTTPException(status_code=404, detail=f"Файл {file_type.value}_{stage_id} не найден")
+        indexed = await self._find_file(test_token, stage_id, file_type)
+        try:
+            return await asyncio.to_thread(indexed.path.read_bytes)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Файл {file_type.value}_{stage_id} не найден")
     
-    async def get_heatmap_stats(self, test_token: str, stage_id: int) -> HeatmapStatsSchema:
-        """Вычисляет агрегированную статистику по тепловой карте"""
-        # Получаем содержимое CSV файла
+    async def get_file_path(self, test_token: str, stage_id: int, file_type: FileType) -> Tuple[Path, os.stat_result]:
+        """Получает путь к файлу и его актуальный stat (без чтения содержимого)"""
+        indexed = await self._find_file(test_token, stage_id, file_type)
+        try:
+            return indexed.path, await asyncio.to_thread(indexed.path.stat)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Файл {file_type.value}_{stage_id} не найден")
+    
+    async def get_export_files(self, test_token: str, file_type: Optional[FileType] = None,
+                               stage_from: Optional[int] = None, stage_to: Optional[int] = None) -> List[IndexedFile]:
+        """Получает файлы теста (CSV и PNG) для экспорта с фильтрацией по типу и диапазону этапов"""
+        index = await self._get_index()
+        return [
+            indexed
+            for indexed in index.list_files(test_token, file_type.value if file_type else None,
+                                            extensions=('.csv', '.png'))
+            if (stage_from is None or indexed.stage_id >= stage_from)
+            and (stage_to is None or indexed.stage_id <= stage_to)
+        ]
+    
+    def iter_archive(self, files: List[IndexedFile], archive_format: ArchiveFormat) -> Iterator[bytes]:
+        """
+        Формирует архив файлов по частям (синхронный генератор: чтение файлов
+        блокирующее, StreamingResponse выполняет его в пуле потоков).
+        Файлы кладутся в архив в папку теста: [имя теста]_[токен]/heatmap_1.csv
+        """
+        entries = ((indexed.path, f"{indexed.path.parent.name}/{indexed.path.name}") for indexed in files)
+        if archive_format == ArchiveFormat.TAR:
+            return iter_tar(entries)
+        return iter_zip(entries)
+    
+    async def _get_stats(self, test_token: str, stage_id: int, file_type: FileType,
+                         compute: Callable[[Path], dict]) -> dict:
+        """Статистика по CSV этапа: вычисляется в отдельном потоке и кешируется до изменения файла"""
+        index = await self._get_index()
+        indexed = index.get(test_token, stage_id, file_type.value, extensions=('.csv',))
+        if indexed is None:
+            raise HTTPException(status_code=404, detail=f"Файл {file_type.value}_{stage_id}.csv не найден")
+        key = (test_token[:8], stage_id, file_type.value)
+        return await asyncio.to_thread(stats_cache.get, key, indexed.path, compute)
+    
+    async def precompute_stats(self, test_token: str, stage_id: int, file_type: FileType) -> None:
+        """Заранее вычисляет статистику загруженного файла и сохраняет сводку"""
+        compute = STATS_FUNCTIONS.get(file_type.value)
+        if compute is None:
+            return
         try:
-            csv_content = await self.get_file_content(test_token, stage_id, FileType.HEATMAP)
+            await self._get_stats(test_token, stage_id, file_type, compute)
         except HTTPException:
-            raise HTTPException(status_code=404, detail=f"Файл heatmap_{stage_id}.csv не найден")
-        
-        # Парсим CSV данные
-        csv_text = csv_content.decode('utf-8')
-        lines = csv_text.strip().split('\n')
-        
-        if len(lines) < 2:
-            raise HTTPException(status_code=400, detail="CSV файл пустой или некорректный")
-        
-        # Пропускаем заголовок и парсим данные
-        data_points = []
-        max_value = 0
-        max_point = None
-        
-        reader = csv.DictReader(lines)
-        for row in reader:
-            try:
-                x = float(row.get('x', 0))
-                y = float(row.get('y', 0))
-                # Используем confidence как значение интенсивности
-                value = float(row.get('confidence', 0))
-                
-                point = {'x': x, 'y': y, 'value': value}
-                data_points.append(point)
-                
-                if value > max_value:
-                    max_value = value
-                    max_point = point
-                    
-            except (ValueError, KeyError):
-                continue
-        
-        if not data_points or max_point is None:
-            raise HTTPException(status_code=400, detail="Нет валидных данных в CSV файле")
-        
-        # Сортируем по значению для поиска медианной точки
-        sorted_points = sorted(data_points, key=lambda p: p['value'])
-        median_index = len(sorted_points) // 2
-        median_point_data = sorted_points[median_index]
-        
-        # Среднее значение интенсивности
-        mean_value = statistics.mean([p['value'] for p in data_points])
-        
-        return HeatmapStatsSchema(
-            test_token=test_token,
-            stage_id=stage_id,
-            max_point=HeatmapPointSchema(x=max_point['x'], y=max_point['y'], value=max_point['value']),
-            mean_value=mean_value,
-            median_point=HeatmapPointSchema(
-                x=median_point_data['x'], 
-                y=median_point_data['y'], 
-                value=median_point_data['value']
-            ),
-            total_points=len(data_points)
-        )
+            # Некорректный файл: ошибка вернется при запросе статистики
+            pass
+    
+    async def get_heatmap_stats(self, test_token: str, stage_id: int) -> HeatmapStatsSchema:
+        """Вычисляет агрегированную статистику по тепловой карте"""
+        stats = await self._get_stats(test_token, stage_id, FileType.HEATMAP, compute_heatmap_stats)
+        return HeatmapStatsSchema(test_token=test_token, stage_id=stage_id, **stats)
     
     async def get_heatmap_first_stats(self, test_token: str, stage_id: int) -> HeatmapFirstStatsSchema:
         """Вычисляет статистику по времени до первой фиксации"""
-        # Получаем содержимое CSV файла
-        try:
-            csv_content = await self.get_file_content(test_token, stage_id, FileType.HEATMAP_FIRST)
-        except HTTPException:
-            raise HTTPException(status_code=404, detail=f"Файл heatmap_first_{stage_id}.csv не найден")
-        
-        # Парсим CSV данные
-        csv_text = csv_content.decode('utf-8')
-        lines = csv_text.strip().split('\n')
-        
-        if len(lines) < 2:
-            raise HTTPException(status_code=400, detail="CSV файл пустой или некорректный")
-        
-        # Парсим данные: ожидаем x, y, time_to_first_fixation
-        data_points = []
-        min_time = float('inf')
-        max_time = 0
-        fastest_point = None
-        slowest_point = None
-        
-        reader = csv.DictReader(lines)
-        for row in reader:
-            try:
-                x = float(row.get('x', 0))
-                y = float(row.get('y', 0))
-                time_value = float(row.get('time_to_first_fixation', 0))
-                
-                point = {'x': x, 'y': y, 'time': time_value}
-                data_points.append(point)
-                
-                if time_value < min_time and time_value > 0:  # Исключаем 0 как отсутствие фиксации
-                    min_time = time_value
-                    fastest_point = point
-                
-                if time_value > max_time:
-                    max_time = time_value
-                    slowest_point = point
-                    
-            except (ValueError, KeyError):
-                continue
-        
-        if not data_points or fastest_point is None or slowest_point is None:
-            raise HTTPException(status_code=400, detail="Нет валидных данных в CSV файле")
-        
-        # Фильтруем точки с реальными фиксациями (time > 0)
-        valid_points = [p for p in data_points if p['time'] > 0]
-        
-        if not valid_points:
-            raise HTTPException(status_code=400, detail="Нет данных о фиксациях")
-        
-        # Среднее и медианное время
-        times = [p['time'] for p in valid_points]
-        mean_time = statistics.mean(times)
-        median_time = statistics.median(times)
-        
-        return HeatmapFirstStatsSchema(
-            test_token=test_token,
-            stage_id=stage_id,
-            fastest_point=HeatmapPointSchema(x=fastest_point['x'], y=fastest_point['y'], value=fastest_point['time']),
-            slowest_point=HeatmapPointSchema(x=slowest_point['x'], y=slowest_point['y'], value=slowest_point['time']),
-            mean_time=mean_time,
-            median_time=median_time,
-            total_areas=len(data_points)
-        )
+        stats = await self._get_stats(test_token, stage_id, FileType.HEATMAP_FIRST, compute_heatmap_first_stats)
+        return HeatmapFirstStatsSchema(test_token=test_token, stage_id=stage_id, **stats)
     
     async def get_heatmap_long_stats(self, test_token: str, stage_id: int) -> HeatmapLongStatsSchema:
-        try:
-            csv_content = await self.get_file_content(test_token, stage_id, FileType.HEATMAP_LONG)
-        except HTTPException:
-            raise HTTPException(status_code=404, detail=f"Файл heatmap_long_{stage_id}.csv не найден")
-        
-        # Парсим CSV данные
-        csv_text = csv_content.decode('utf-8')
-        lines = csv_text.strip().split('\n')
-        
-        if len(lines) < 2:
-            raise HTTPException(status_code=400, detail="CSV файл пустой или некорректный")
-        
-        # Парсим данные: ожидаем x, y, fixation_duration
-        data_points = []
-        min_duration = float('inf')
-        max_duration = 0
-        shortest_point = None
-        longest_point = None
-        
-        reader = csv.DictReader(lines)
-        for row in reader:
-            try:
-                x = float(row.get('x', 0))
-                y = float(row.get('y', 0))
-                duration = float(row.get('fixation_duration', 0))
-                
-                point = {'x': x, 'y': y, 'duration': duration}
-                data_points.append(point)
-                
-                if duration < min_duration and duration > 0:  # Исключаем 0 как отсутствие фиксации
-                    min_duration = duration
-                    shortest_point = point
-                
-                if duration > max_duration:
-                    max_duration = duration
-                    longest_point = point
-                    
-            except (ValueError, KeyError):
-                continue
-        
-        if not data_points or shortest_point is None or longest_point is None:
-            raise HTTPException(status_code=400, detail="Нет валидных данных в CSV файле")
-        
-        # Фильтруем точки с реальными фиксациями (duration > 0)
-        valid_points = [p for p in data_points if p['duration'] > 0]
-        
-        if not valid_points:
-            raise HTTPException(status_code=400, detail="Нет данных о фиксациях")
-        
-        # Среднее и медианное время
-        durations = [p['duration'] for p in valid_points]
-        mean_duration = statistics.mean(durations)
-        median_duration = statistics.median(durations)
-        
-        return HeatmapLongStatsSchema(
-            test_token=test_token,
-            stage_id=stage_id,
-            longest_point=HeatmapPointSchema(x=longest_point['x'], y=longest_point['y'], value=longest_point['duration']),
-            shortest_point=HeatmapPointSchema(x=shortest_point['x'], y=shortest_point['y'], value=shortest_point['duration']),
-            mean_duration=mean_duration,
-            median_duration=median_duration,
-            total_fixations=len(valid_points)
-        )
+        """Вычисляет статистику по длительности фиксаций"""
+        stats = await self._get_stats(test_token, stage_id, FileType.HEATMAP_LONG, compute_heatmap_long_stats)
+        return HeatmapLongStatsSchema(test_token=test_token, stage_id=stage_id, **stats)
 
 class DataRepositoryFactoryProtocol(Protocol):
     async def make(self) -> DataRepositoryProtocol:
@@ -0,0 +1,244 @@
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import os
+import threading
+import time
+
+
+@dataclass(frozen=True)
+class IndexedFile:
+    """Файл данных в индексе"""
+    path: Path
+    test_name: str
+    stage_id: int
+    file_type: str
+    size: int
+    mtime: float
+
+    @property
+    def upload_time(self) -> datetime:
+        return datetime.fromtimestamp(self.mtime)
+
+
+def parse_data_filename(filename: str) -> Optional[Tuple[str, int, str]]:
+    """Разбирает имя файла вида heatmap_first_1.csv в (тип файла, номер этапа, расширение)"""
+    stem, extension = os.path.splitext(filename)
+    name_parts = stem.split('_')
+    if len(name_parts) < 2:
+        return None
+    # Последняя часть всегда stage_id, остальные составляют тип файла
+    try:
+        stage_id = int(name_parts[-1])
+    except ValueError:
+        return None
+    return '_'.join(name_parts[:-1]), stage_id, extension.lower()
+
+
+# Каталог, измененный недавно по сравнению с моментом обхода, мог измениться
+# еще раз в пределах точности времени файловой системы - такой обход не считается окончательным
+RACY_MTIME_WINDOW_NS = 2_000_000_000
+
+
+def _dir_mtime_ns(path) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class DataFileIndex:
+    """
+    Индекс файлов данных в памяти: (токен, этап, тип файла) -> файлы по расширениям.
+
+    Строится одним проходом по каталогу данных при первом обращении и
+    обновляется при загрузке файлов, поэтому поиск файла и список файлов
+    теста не требуют обхода файловой системы.
+
+    Файлы, которые трекер и скрипты анализа добавляют или удаляют напрямую,
+    обнаруживаются по времени изменения каталогов: перед поиском проверяется
+    каталог данных (новые и удаленные тесты - полное перестроение) и каталоги
+    теста (повторный обход только этого теста).
+
+    Построение и добавление файлов выполняются под одной блокировкой: индекс
+    строится один раз, даже если первые запросы пришли одновременно, а файл,
+    добавленный во время обхода, не теряется при замене содержимого индекса.
+    """
+
+    def __init__(self, base_data_dir: Path):
+        self.base_data_dir = Path(base_data_dir)
+        self._lock = threading.Lock()
+        # Блокировка построения: обход каталога и add не выполняются одновременно
+        self._build_lock = threading.RLock()
+        self._built = False
+        # token[:8] -> (stage_id, file_type) -> extension -> IndexedFile
+        self._entries: Dict[str, Dict[Tuple[int, str], Dict[str, IndexedFile]]] = {}
+        # token[:8] -> каталог теста -> st_mtime_ns при обходе (None - проверить снова)
+        self._dirs: Dict[str, Dict[str, Optional[int]]] = {}
+        self._base_mtime_ns: Optional[int] = None
+
+    @staticmethod
+    def _token_key(test_token: str) -> str:
+        # Каталоги тестов содержат только первые 8 символов токена
+        return test_token[:8]
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def ensure_built(self) -> None:
+        """Строит индекс, если он еще не построен (остальные потоки ждут окончания построения)"""
+        if self._built:
+            return
+        with self._build_lock:
+            if not self._built:
+                self.rebuild()
+
+    def rebuild(self) -> None:
+        """Полностью перестраивает индекс по содержимому каталога данных"""
+        with self._build_lock:
+            self._rebuild()
+
+    def _rebuild(self) -> None:
+        started_ns = time.time_ns()
+        base_mtime_ns = self._checked_mtime(self.base_data_dir, started_ns)
+        entries: Dict[str, Dict[Tuple[int, str], Dict[str, IndexedFile]]] = {}
+        dirs: Dict[str, Dict[str, Optional[int]]] = {}
+        if self.base_data_dir.is_dir():
+            with os.scandir(self.base_data_dir) as test_dirs:
+                for test_dir in test_dirs:
+                    if not test_dir.is_dir() or '_' not in test_dir.name:
+                        continue
+                    token_key = test_dir.name.rsplit('_', 1)[1]
+                    dirs.setdefault(token_key, {})[test_dir.path] = self._scan_test_dir(
+                        test_dir.path, entries, started_ns)
+        with self._lock:
+            self._entries = entries
+            self._dirs = dirs
+            self._base_mtime_ns = base_mtime_ns
+            self._built = True
+
+    def _rescan_token(self, token_key: str) -> None:
+        """Повторно обходит каталоги одного теста"""
+        started_ns = time.time_ns()
+        entries: Dict[str, Dict[Tuple[int, str], Dict[str, IndexedFile]]] = {}
+        with self._lock:
+            test_dirs = list(self._dirs.get(token_key, {}))
+        dirs = {path: self._scan_test_dir(path, entries, started_ns) for path in test_dirs}
+        with self._lock:
+            self._entries[token_key] = entries.get(token_key, {})
+            self._dirs[token_key] = dirs
+
+    def _scan_test_dir(self, path: str, entries, started_ns: int) -> Optional[int]:
+        """Добавляет файлы каталога теста в entries и возвращает время изменения каталога"""
+        mtime_ns = self._checked_mtime(path, started_ns)
+        test_name, token_key = os.path.basename(path).rsplit('_', 1)
+        try:
+            with os.scandir(path) as files:
+                for entry in files:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    indexed = self._make_entry(Path(entry.path), test_name, stat)
+                    if indexed is not None:
+                        self._put(entries, token_key, indexed)
+        except FileNotFoundError:
+            return None
+        return mtime_ns
+
+    @staticmethod
+    def _checked_mtime(path, started_ns: int) -> Optional[int]:
+        mtime_ns = _dir_mtime_ns(path)
+        if mtime_ns is not None and mtime_ns >= started_ns - RACY_MTIME_WINDOW_NS:
+            return None
+        return mtime_ns
+
+    def _refresh(self, token_key: str) -> None:
+        """Обновляет индекс теста, если каталоги изменились на диске после обхода"""
+        self.ensure_built()
+        with self._lock:
+            base_mtime_ns = self._base_mtime_ns
+            test_dirs = dict(self._dirs.get(token_key, {}))
+        if base_mtime_ns is None or _dir_mtime_ns(self.base_data_dir) != base_mtime_ns:
+            # Тест создан или удален
+            with self._build_lock:
+                self._rebuild()
+            return
+        if any(mtime_ns is None or _dir_mtime_ns(path) != mtime_ns for path, mtime_ns in test_dirs.items()):
+            with self._build_lock:
+                self._rescan_token(token_key)
+
+    def add(self, file_path: Path, test_name: str) -> Optional[IndexedFile]:
+        """Добавляет (или обновляет) файл после записи на диск"""
+        token_key = file_path.parent.name.rsplit('_', 1)[-1]
+        with self._build_lock:
+            # Если индекс еще не построен, обход каталога найдет и этот файл
+            self.ensure_built()
+            indexed = self._make_entry(file_path, test_name, file_path.stat())
+            if indexed is not None:
+                with self._lock:
+                    self._put(self._entries, token_key, indexed)
+        return indexed
+
+    def get(self, test_token: str, stage_id: int, file_type: str,
+            extensions: Tuple[str, ...] = ('.csv', '.png')) -> Optional[IndexedFile]:
+        """Находит файл этапа; при нескольких расширениях берется первое из extensions"""
+        self._refresh(self._token_key(test_token))
+        with self._lock:
+            by_extension = self._entries.get(self._token_key(test_token), {}).get((stage_id, file_type), {})
+            for extension in extensions:
+                if extension in by_extension:
+                    return by_extension[extension]
+        return None
+
+    def list_files(self, test_token: str, file_type: Optional[str] = None, stage_id: Optional[int] = None,
+                   extensions: Tuple[str, ...] = ('.csv',)) -> List[IndexedFile]:
+        """Файлы теста с фильтрацией по типу и этапу, по порядку этапов"""
+        self._refresh(self._token_key(test_token))
+        with self._lock:
+            stages = self._entries.get(self._token_key(test_token), {})
+            files = [
+                indexed
+                for (current_stage_id, current_file_type), by_extension in stages.items()
+                if (not file_type or current_file_type == file_type)
+                and (not stage_id or current_stage_id == stage_id)
+                for extension, indexed in by_extension.items()
+                if extension in extensions
+            ]
+        return sorted(files, key=lambda f: (f.stage_id, f.file_type, f.path.name))
+
+    @staticmethod
+    def _make_entry(file_path: Path, test_name: str, stat: os.stat_result) -> Optional[IndexedFile]:
+        parsed = parse_data_filename(file_path.name)
+        if parsed is None:
+            return None
+        file_type, stage_id, _ = parsed
+        return IndexedFile(
+            path=file_path,
+            test_name=test_name,
+            stage_id=stage_id,
+            file_type=file_type,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+        )
+
+    @staticmethod
+    def _put(entries, token_key: str, indexed: IndexedFile) -> None:
+        extension = indexed.path.suffix.lower()
+        entries.setdefault(token_key, {}).setdefault((indexed.stage_id, indexed.file_type), {})[extension] = indexed
+
+
+_file_indexes: Dict[Path, DataFileIndex] = {}
+_file_indexes_lock = threading.Lock()
+
+
+def get_file_index(base_data_dir: Path) -> DataFileIndex:
+    """Общий для процесса индекс каталога данных"""
+    key = Path(base_data_dir).resolve()
+    with _file_indexes_lock:
+        index = _file_indexes.get(key)
+        if index is None:
+            index = _file_indexes[key] = DataFileIndex(Path(base_data_dir))
+        return index
@@ -0,0 +1,227 @@
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+import csv
+import json
+import os
+import threading
+
+import numpy as np
+from fastapi import HTTPException
+
+
+def load_columns(file_path: Path, columns: Sequence[str]) -> Dict[str, np.ndarray]:
+    """
+    Читает нужные колонки CSV в массивы float64.
+    Отсутствующие колонки заполняются нулями, строки с пустыми или
+    некорректными значениями пропускаются.
+    """
+    with open(file_path, encoding='utf-8', newline='') as f:
+        header = [name.strip() for name in next(csv.reader([f.readline()]), [])]
+        data_start = f.tell()
+        # Достаточно убедиться, что после заголовка есть хотя бы одна непустая строка
+        while True:
+            line = f.readline()
+            if not line:
+                raise HTTPException(status_code=400, detail="CSV файл пустой или некорректный")
+            if line.strip():
+                break
+        f.seek(data_start)
+
+        if all(column in header for column in columns):
+            try:
+                data = np.loadtxt(f, delimiter=',', ndmin=2, comments=None,
+                                  usecols=[header.index(column) for column in columns])
+                return {column: data[:, i] for i, column in enumerate(columns)}
+            except ValueError:
+                # Есть пустые или некорректные значения - разбираем построчно
+                f.seek(data_start)
+
+        rows = _parse_rows(f, header, columns)
+    data = np.array(rows, dtype=np.float64).reshape(-1, len(columns))
+    return {column: data[:, i] for i, column in enumerate(columns)}
+
+
+def _parse_rows(lines: Iterable[str], header: List[str], columns: Sequence[str]) -> List[List[float]]:
+    """Построчный разбор: пропускает строки, где значение нужной колонки пустое, отсутствует или не число"""
+    positions = [header.index(column) if column in header else None for column in columns]
+    rows = []
+    for row in csv.reader(lines):
+        if not row:
+            continue
+        try:
+            rows.append([0.0 if position is None else float(row[position]) for position in positions])
+        except (ValueError, IndexError):
+            continue
+    return rows
+
+
+def median(values: np.ndarray) -> float:
+    """Медиана через частичную сортировку (np.partition), без полной сортировки"""
+    n = len(values)
+    middle = n // 2
+    if n % 2:
+        return float(np.partition(values, middle)[middle])
+    lower, upper = np.partition(values, [middle - 1, middle])[middle - 1:middle + 1]
+    return float((lower + upper) / 2)
+
+
+def percentiles(values: np.ndarray) -> Dict[str, float]:
+    """Процентили распределения значений"""
+    levels = (10, 25, 75, 90)
+    return {f"p{level}": float(value) for level, value in zip(levels, np.percentile(values, levels))}
+
+
+def _stable_kth_index(values: np.ndarray, k: int) -> int:
+    """
+    Индекс k-го элемента в устойчивой сортировке по значению за O(n):
+    среди равных значений берется тот же элемент, что и при sorted()
+    """
+    kth = np.partition(values, k)[k]
+    ties = np.flatnonzero(values == kth)
+    return int(ties[k - np.count_nonzero(values < kth)])
+
+
+def _point(data: Dict[str, np.ndarray], index: int, value_column: str) -> dict:
+    return {'x': float(data['x'][index]), 'y': float(data['y'][index]),
+            'value': float(data[value_column][index])}
+
+
+def compute_heatmap_stats(file_path: Path) -> dict:
+    """Максимум, среднее и медианная точка по интенсивности (confidence)"""
+    data = load_columns(file_path, ('x', 'y', 'confidence'))
+    values = data['confidence']
+    if len(values) == 0 or values.max() <= 0:
+        raise HTTPException(status_code=400, detail="Нет валидных данных в CSV файле")
+
+    # Точка с медианным значением: выбор k-го элемента вместо сортировки всех точек
+    median_index = _stable_kth_index(values, len(values) // 2)
+    return {
+        'max_point': _point(data, int(np.argmax(values)), 'confidence'),
+        'mean_value': float(values.mean()),
+        'median_point': _point(data, median_index, 'confidence'),
+        'percentiles': percentiles(values),
+        'total_points': len(values),
+    }
+
+
+def _positive_extremes(data: Dict[str, np.ndarray], column: str) -> Tuple[dict, dict, np.ndarray]:
+    """Точки с наименьшим положительным и наибольшим значением, массив положительных значений"""
+    values = data[column]
+    valid = values > 0
+    if not valid.any():
+        # Ноль означает отсутствие фиксации
+        raise HTTPException(status_code=400, detail="Нет валидных данных в CSV файле")
+    lowest = int(np.argmin(np.where(valid, values, np.inf)))
+    highest = int(np.argmax(values))
+    return _point(data, lowest, column), _point(data, highest, column), values[valid]
+
+
+def compute_heatmap_first_stats(file_path: Path) -> dict:
+    """Статистика по времени до первой фиксации (time_to_first_fixation)"""
+    data = load_columns(file_path, ('x', 'y', 'time_to_first_fixation'))
+    fastest, slowest, times = _positive_extremes(data, 'time_to_first_fixation')
+    return {
+        'fastest_point': fastest,
+        'slowest_point': slowest,
+        'mean_time': float(times.mean()),
+        'median_time': median(times),
+        'percentiles': percentiles(times),
+        'total_areas': len(data['x']),
+    }
+
+
+def compute_heatmap_long_stats(file_path: Path) -> dict:
+    """Статистика по длительности фиксаций (fixation_duration)"""
+    data = load_columns(file_path, ('x', 'y', 'fixation_duration'))
+    shortest, longest, durations = _positive_extremes(data, 'fixation_duration')
+    return {
+        'longest_point': longest,
+        'shortest_point': shortest,
+        'mean_duration': float(durations.mean()),
+        'median_duration': median(durations),
+        'percentiles': percentiles(durations),
+        'total_fixations': len(durations),
+    }
+
+
+# Функции статистики по типу файла (FileType.value)
+STATS_FUNCTIONS: Dict[str, Callable[[Path], dict]] = {
+    'heatmap': compute_heatmap_stats,
+    'heatmap_first': compute_heatmap_first_stats,
+    'heatmap_long': compute_heatmap_long_stats,
+}
+
+# Версия формата сводки: при изменении расчета старые сводки пересчитываются
+SIDECAR_VERSION = 2
+
+
+def sidecar_path(file_path: Path) -> Path:
+    """Файл сводки рядом с файлом данных: heatmap_1.csv -> heatmap_1.csv.stats.json"""
+    return file_path.with_name(file_path.name + '.stats.json')
+
+
+def read_sidecar(file_path: Path, version: Tuple[int, int]) -> Optional[dict]:
+    """Читает сводку, если она посчитана для текущей версии файла"""
+    try:
+        with open(sidecar_path(file_path), encoding='utf-8') as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if summary.get('format') != SIDECAR_VERSION or summary.get('source') != list(version):
+        return None
+    return summary.get('stats')
+
+
+def write_sidecar(file_path: Path, version: Tuple[int, int], stats: dict) -> None:
+    """Атомарно записывает сводку рядом с файлом данных"""
+    path = sidecar_path(file_path)
+    temp_path = path.with_name(path.name + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'format': SIDECAR_VERSION, 'source': list(version), 'stats': stats}, f)
+    os.replace(temp_path, path)
+
+
+class StatsCache:
+    """
+    Кеш вычисленной статистики по ключу (токен, этап, тип файла).
+    Запись действительна, пока не изменились время изменения и размер файла.
+    Вычисленная статистика также сохраняется в сводку рядом с файлом
+    (см. sidecar_path), поэтому переживает перезапуск сервиса.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[Tuple[int, int], dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, file_path: Path, compute: Callable[[Path], dict]) -> dict:
+        """Возвращает статистику из кеша или вычисляет ее (вызывать в рабочем потоке)"""
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Файл {file_path.name} не найден")
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(key)
+                return cached[1]
+
+        result = read_sidecar(file_path, version)
+        if result is None:
+            result = compute(file_path)
+            try:
+                write_sidecar(file_path, version, result)
+            except OSError:
+                pass
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return result
+
+
+stats_cache = StatsCache()
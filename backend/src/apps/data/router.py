@@ -1,6 +1,6 @@
-from fastapi import APIRouter, UploadFile, File, Form, Depends, Query, Response
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, Form, Depends, Header, Query, Response
 from typing import Optional
-from .schemas.data import DataFileSchema, FileType, FileListSchema, HeatmapStatsSchema, HeatmapFirstStatsSchema, HeatmapLongStatsSchema
+from .schemas.data import ArchiveFormat, DataFileSchema, FileType, FileListSchema, HeatmapStatsSchema, HeatmapFirstStatsSchema, HeatmapLongStatsSchema
 from .services import DataServiceProtocol
 from .depends import get_data_service
 
@@ -9,13 +9,14 @@ router = APIRouter(prefix='/data', tags=['Данные'])
 
 @router.post('/upload', response_model=DataFileSchema)
 async def upload_data_file(
+    background_tasks: BackgroundTasks,
     test_token: str = Form(..., description="Токен теста"),
     stage_id: int = Form(..., description="Номер этапа"),
     file: UploadFile = File(..., description="CSV файл с данными"),
     data_service: DataServiceProtocol = Depends(get_data_service)
 ) -> DataFileSchema:
     """Загрузка файла данных для указанного теста и этапа"""
-    return await data_service.upload_data_file(file, test_token, stage_id)
+    return await data_service.upload_data_file(file, test_token, stage_id, background_tasks)
 
 @router.get('/files', response_model=FileListSchema)
 async def get_files_list(
@@ -32,10 +33,24 @@ async def download_file(
     test_token: str = Query(..., description="Токен теста"),
     stage_id: int = Query(..., description="Номер этапа"),
     file_type: FileType = Query(..., description="Тип файла"),
+    if_none_match: Optional[str] = Header(None, description="ETag сохраненной копии файла"),
+    if_modified_since: Optional[str] = Header(None, description="Время изменения сохраненной копии файла"),
     data_service: DataServiceProtocol = Depends(get_data_service)
 ) -> Response:
-    """Скачивание файла (CSV или PNG)"""
-    return await data_service.download_file(test_token, stage_id, file_type)
+    """Скачивание файла (CSV или PNG), поддерживаются Range и условные запросы"""
+    return await data_service.download_file(test_token, stage_id, file_type, if_none_match, if_modified_since)
+
+@router.get('/export')
+async def export_files(
+    test_token: str = Query(..., description="Токен теста"),
+    file_type: Optional[FileType] = Query(None, description="Тип файла"),
+    stage_from: Optional[int] = Query(None, description="Начальный этап (включительно)"),
+    stage_to: Optional[int] = Query(None, description="Конечный этап (включительно)"),
+    archive_format: ArchiveFormat = Query(ArchiveFormat.ZIP, alias='format', description="Формат архива (zip/tar)"),
+    data_service: DataServiceProtocol = Depends(get_data_service)
+) -> Response:
+    """Экспорт всех файлов теста (CSV и PNG) одним потоковым архивом"""
+    return await data_service.export_files(test_token, file_type, stage_from, stage_to, archive_format)
 
 @router.get('/stats/heatmap', response_model=HeatmapStatsSchema)
 async def get_heatmap_stats(
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from fastapi import UploadFile
-from typing import Optional, List, Literal
+from typing import Optional, List, Literal, Dict
 from datetime import datetime
 from enum import Enum
 
@@ -19,6 +19,7 @@ class DataFileSchema(BaseModel):
     test_name: str = Field(..., description="Название теста")
     upload_time: datetime = Field(default_factory=datetime.now, description="Время загрузки")
     file_size: int = Field(..., description="Размер файла в байтах")
+    checksum: Optional[str] = Field(None, description="SHA-256 содержимого файла (при загрузке)")
 
 class FileType(str, Enum):
     """Типы файлов данных"""
@@ -27,6 +28,11 @@ class FileType(str, Enum):
     HEATMAP_LONG = "heatmap_long"
     SACCADES = "saccades"
 
+class ArchiveFormat(str, Enum):
+    """Форматы архива для экспорта файлов"""
+    ZIP = "zip"
+    TAR = "tar"
+
 class GetFilesQuerySchema(BaseModel):
     """Схема запроса для получения файлов"""
     test_token: str = Field(..., description="Токен теста")
@@ -46,6 +52,7 @@ class HeatmapStatsSchema(BaseModel):
     max_point: HeatmapPointSchema = Field(..., description="Точка с максимальным значением")
     mean_value: float = Field(..., description="Среднее значение интенсивности")
     median_point: HeatmapPointSchema = Field(..., description="Точка с медианным значением")
+    percentiles: Optional[Dict[str, float]] = Field(None, description="Процентили интенсивности (p10, p25, p75, p90)")
     total_points: int = Field(..., description="Общее количество точек")
 
 class HeatmapFirstStatsSchema(BaseModel):
@@ -56,6 +63,7 @@ class HeatmapFirstStatsSchema(BaseModel):
     slowest_point: HeatmapPointSchema = Field(..., description="Точка с наибольшим временем до первой фиксации")
     mean_time: float = Field(..., description="Среднее время до первой фиксации (мс)")
     median_time: float = Field(..., description="Медианное время до первой фиксации (мс)")
+    percentiles: Optional[Dict[str, float]] = Field(None, description="Процентили времени до первой фиксации (мс)")
     total_areas: int = Field(..., description="Общее количество областей")
 
 class HeatmapLongStatsSchema(BaseModel):
@@ -66,6 +74,7 @@ class HeatmapLongStatsSchema(BaseModel):
     shortest_point: HeatmapPointSchema = Field(..., description="Точка с наименьшей длительностью фиксации")
     mean_duration: float = Field(..., description="Средняя длительность фиксации (мс)")
     median_duration: float = Field(..., description="Медианная длительность фиксации (мс)")
+    percentiles: Optional[Dict[str, float]] = Field(None, description="Процентили длительности фиксаций (мс)")
     total_fixations: int = Field(..., description="Общее количество фиксаций")
 
 class FileListSchema(BaseModel):
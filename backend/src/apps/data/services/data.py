@@ -1,11 +1,58 @@
 from typing import Protocol, Optional
-from fastapi import HTTPException, status, UploadFile, Response
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+from fastapi import BackgroundTasks, HTTPException, status, UploadFile, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from ..repositories import DataRepositoryFactoryProtocol
-from ..schemas.data import DataFileSchema, FileType, HeatmapStatsSchema, HeatmapFirstStatsSchema, HeatmapLongStatsSchema, FileListSchema
+from ..repositories.file_index import parse_data_filename
+from ..repositories.stats import STATS_FUNCTIONS
+from ..schemas.data import ArchiveFormat, DataFileSchema, FileType, HeatmapStatsSchema, HeatmapFirstStatsSchema, HeatmapLongStatsSchema, FileListSchema
 from ...tracking.repositories import TrackingRepositoryFactoryProtocol
 
+# MIME типы скачиваемых файлов по расширению
+DOWNLOAD_MEDIA_TYPES = {
+    '.csv': "text/csv",
+    '.png': "image/png",
+}
+
+# MIME типы архивов экспорта
+ARCHIVE_MEDIA_TYPES = {
+    ArchiveFormat.ZIP: "application/zip",
+    ArchiveFormat.TAR: "application/x-tar",
+}
+
+
+def content_disposition(filename: str) -> str:
+    """
+    Заголовок Content-Disposition для вложения. Заголовки передаются в latin-1,
+    поэтому имя не в ASCII (например, кириллическое имя теста) передается
+    в filename* (RFC 5987) вместе с ASCII-заменой для старых клиентов.
+    """
+    quoted = quote(filename)
+    if quoted == filename:
+        return f'attachment; filename="{filename}"'
+    fallback = "".join(c if c.isascii() and c.isprintable() and c not in '"\\' else '_' for c in filename)
+    return f"attachment; filename=\"{fallback}\"; filename*=utf-8''{quoted}"
+
+
+def is_not_modified(etag: str, last_modified: str, if_none_match: Optional[str] = None,
+                    if_modified_since: Optional[str] = None) -> bool:
+    """Проверяет условный запрос: клиенту можно ответить 304 без тела"""
+    if if_none_match is not None:
+        # If-None-Match сравнивается слабо и имеет приоритет над If-Modified-Since
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(last_modified) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
 class DataServiceProtocol(Protocol):
-    async def upload_data_file(self, file: UploadFile, test_token: str, stage_id: int) -> DataFileSchema:
+    async def upload_data_file(self, file: UploadFile, test_token: str, stage_id: int,
+                               background_tasks: Optional[BackgroundTasks] = None) -> DataFileSchema:
         """Загружает файл данных"""
         ...
     
@@ -13,10 +60,17 @@ class DataServiceProtocol(Protocol):
         """Получает список файлов с фильтрацией"""
         ...
     
-    async def download_file(self, test_token: str, stage_id: int, file_type: FileType) -> Response:
+    async def download_file(self, test_token: str, stage_id: int, file_type: FileType,
+                            if_none_match: Optional[str] = None, if_modified_since: Optional[str] = None) -> Response:
         """Скачивает файл"""
         ...
     
+    async def export_files(self, test_token: str, file_type: Optional[FileType] = None,
+                           stage_from: Optional[int] = None, stage_to: Optional[int] = None,
+                           archive_format: ArchiveFormat = ArchiveFormat.ZIP) -> StreamingResponse:
+        """Экспортирует файлы теста одним архивом"""
+        ...
+    
     async def get_heatmap_stats(self, test_token: str, stage_id: int) -> HeatmapStatsSchema:
         """Получает агрегированную статистику по тепловой карте"""
         ...
@@ -36,8 +90,12 @@ class DataServiceImpl:
         self.data_repository = data_repository
         self.tracking_repository = tracking_repository
     
-    async def upload_data_file(self, file: UploadFile, test_token: str, stage_id: int) -> DataFileSchema:
-        """Загружает файл данных с проверкой существования теста и этапа"""
+    async def upload_data_file(self, file: UploadFile, test_token: str, stage_id: int,
+                               background_tasks: Optional[BackgroundTasks] = None) -> DataFileSchema:
+        """
+        Загружает файл данных с проверкой существования теста и этапа.
+        Для файлов тепловых карт статистика считается после ответа (в background_tasks).
+        """
         
         # Проверяем существование теста
         tracking_repo = await self.tracking_repository.make()
@@ -65,7 +123,14 @@ class DataServiceImpl:
         
         # Сохраняем файл
         data_repo = await self.data_repository.make()
-        return await data_repo.save_data_file(file, test_token, stage_id, test.name)
+        saved = await data_repo.save_data_file(file, test_token, stage_id, test.name)
+        
+        # Сводка статистики считается один раз, вне обработки запроса
+        parsed = parse_data_filename(saved.filename)
+        if background_tasks is not None and parsed and parsed[0] in STATS_FUNCTIONS:
+            file_type, file_stage_id, _ = parsed
+            background_tasks.add_task(data_repo.precompute_stats, test_token, file_stage_id, FileType(file_type))
+        return saved
     
     async def get_files_list(self, test_token: str, file_type: Optional[FileType] = None, stage_id: Optional[int] = None) -> FileListSchema:
         """Получает список файлов с фильтрацией и проверкой доступа"""
@@ -81,8 +146,13 @@ class DataServiceImpl:
         data_repo = await self.data_repository.make()
         return await data_repo.get_files_list(test_token, file_type, stage_id)
     
-    async def download_file(self, test_token: str, stage_id: int, file_type: FileType) -> Response:
-        """Скачивает файл с проверкой доступа"""
+    async def download_file(self, test_token: str, stage_id: int, file_type: FileType,
+                            if_none_match: Optional[str] = None, if_modified_since: Optional[str] = None) -> Response:
+        """
+        Скачивает файл с проверкой доступа.
+        Файл отдается потоком с диска (FileResponse: sendfile, Range), а на
+        условный запрос с актуальным ETag/Last-Modified возвращается 304 без тела.
+        """
         # Проверяем существование теста
         tracking_repo = await self.tracking_repository.make()
         test = await tracking_repo.get_test_by_token(test_token)
@@ -92,24 +162,62 @@ class DataServiceImpl:
                 detail="Тест с указанным токеном не найден"
             )
         
-        # Получаем содержимое файла
+        # Находим файл без чтения содержимого
         data_repo = await self.data_repository.make()
-        file_content = await data_repo.get_file_content(test_token, stage_id, file_type)
+        file_path, stat_result = await data_repo.get_file_path(test_token, stage_id, file_type)
         
-        # Определяем MIME тип и расширение
-        if file_content.startswith(b'\x89PNG'):  # PNG signature
-            media_type = "image/png"
-            extension = "png"
-        else:
-            media_type = "text/csv"
-            extension = "csv"
+        # ETag и Last-Modified FileResponse вычисляет по stat файла
+        response = FileResponse(
+            file_path,
+            media_type=DOWNLOAD_MEDIA_TYPES.get(file_path.suffix.lower(), "application/octet-stream"),
+            filename=file_path.name,
+            stat_result=stat_result,
+            # Клиент хранит файл, но перед использованием проверяет его актуальность
+            headers={"Cache-Control": "no-cache"}
+        )
+        if is_not_modified(response.headers["etag"], response.headers["last-modified"],
+                           if_none_match, if_modified_since):
+            return Response(
+                status_code=status.HTTP_304_NOT_MODIFIED,
+                headers={name: response.headers[name] for name in ("etag", "last-modified", "cache-control")}
+            )
+        return response
+    
+    async def export_files(self, test_token: str, file_type: Optional[FileType] = None,
+                           stage_from: Optional[int] = None, stage_to: Optional[int] = None,
+                           archive_format: ArchiveFormat = ArchiveFormat.ZIP) -> StreamingResponse:
+        """
+        Экспортирует файлы теста одним архивом с проверкой доступа.
+        Архив формируется по мере отправки, поэтому память не зависит от числа файлов.
+        """
+        # Проверяем существование теста
+        tracking_repo = await self.tracking_repository.make()
+        test = await tracking_repo.get_test_by_token(test_token)
+        if not test:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Тест с указанным токеном не найден"
+            )
+        
+        if stage_from is not None and stage_to is not None and stage_from > stage_to:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Начальный этап больше конечного"
+            )
         
-        filename = f"{file_type.value}_{stage_id}.{extension}"
+        data_repo = await self.data_repository.make()
+        files = await data_repo.get_export_files(test_token, file_type, stage_from, stage_to)
+        if not files:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Файлы для экспорта не найдены"
+            )
         
-        return Response(
-            content=file_content,
-            media_type=media_type,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+        filename = f"{files[0].path.parent.name}.{archive_format.value}"
+        return StreamingResponse(
+            data_repo.iter_archive(files, archive_format),
+            media_type=ARCHIVE_MEDIA_TYPES[archive_format],
+            headers={"Content-Disposition": content_disposition(filename)}
         )
     
     async def get_heatmap_stats(self, test_token: str, stage_id: int) -> HeatmapStatsSchema:
@@ -0,0 +1,20 @@
+import os
+
+# Настройки приложения обязательны при импорте сервисов; в тестах достаточно заглушек
+for name, value in {
+    'DEBUG': 'true',
+    'BASE_URL': 'http://testserver',
+    'SECRET_KEY': 'test',
+    'CORS_ORIGINS': '[]',
+    'DB__HOST': 'localhost',
+    'DB__PORT': '5432',
+    'DB__USER': 'test',
+    'DB__PASSWORD': 'test',
+    'DB__NAME': 'test',
+    'DB__SCHEME': 'public',
+    'REDIS_DSN': 'redis://localhost:6379/0',
+    'JWT_SECRET': 'test',
+    'JWT_ALGORITHM': 'HS256',
+    'JWT_EXPIRE_HOURS': '1',
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,135 @@
+from datetime import timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.apps.data.depends import get_data_service
+from src.apps.data.repositories import DataRepositoryImpl
+from src.apps.data.router import router
+from src.apps.data.services.data import DataServiceImpl, is_not_modified
+
+TOKEN = 'abcdef1234567890'
+CONTENT = b'x,y,confidence\n0.1,0.2,1\n0.3,0.4,2\n'
+PARAMS = {'test_token': TOKEN, 'stage_id': 1, 'file_type': 'heatmap'}
+
+
+class _Factory:
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def make(self):
+        return self.repository
+
+
+class _TrackingRepository:
+    async def get_test_by_token(self, test_token):
+        return SimpleNamespace(name='test') if test_token == TOKEN else None
+
+
+@pytest.fixture
+def client(tmp_path):
+    data_dir = tmp_path / 'data'
+    test_dir = data_dir / 'My_Test_abcdef12'
+    test_dir.mkdir(parents=True)
+    (test_dir / 'heatmap_1.csv').write_bytes(CONTENT)
+
+    app = FastAPI()
+    app.include_router(router)
+    repository = DataRepositoryImpl(str(data_dir))
+    app.dependency_overrides[get_data_service] = lambda: DataServiceImpl(
+        _Factory(repository), _Factory(_TrackingRepository()))
+    return TestClient(app)
+
+
+@pytest.fixture
+def validators(client):
+    response = client.get('/data/download', params=PARAMS)
+    assert response.status_code == 200
+    return response.headers['etag'], response.headers['last-modified']
+
+
+def test_download_returns_file_with_validators(client):
+    response = client.get('/data/download', params=PARAMS)
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers['cache-control'] == 'no-cache'
+    assert response.headers['accept-ranges'] == 'bytes'
+    assert response.headers['etag'] and response.headers['last-modified']
+
+
+@pytest.mark.parametrize('if_none_match', [
+    '{etag}',
+    'W/{etag}',
+    '"other", {etag}',
+    '*',
+])
+def test_download_matching_etag_is_not_modified(client, validators, if_none_match):
+    etag, last_modified = validators
+
+    response = client.get('/data/download', params=PARAMS,
+                          headers={'If-None-Match': if_none_match.format(etag=etag)})
+
+    assert response.status_code == 304
+    assert response.content == b''
+    assert response.headers['etag'] == etag
+    assert response.headers['last-modified'] == last_modified
+    assert response.headers['cache-control'] == 'no-cache'
+
+
+def test_download_other_etag_returns_file(client, validators):
+    response = client.get('/data/download', params=PARAMS, headers={'If-None-Match': '"other"'})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_download_not_modified_since_last_modified(client, validators):
+    _, last_modified = validators
+
+    response = client.get('/data/download', params=PARAMS, headers={'If-Modified-Since': last_modified})
+
+    assert response.status_code == 304
+    assert response.content == b''
+
+
+def test_download_modified_since_older_date_returns_file(client, validators):
+    _, last_modified = validators
+    older = format_datetime(parsedate_to_datetime(last_modified) - timedelta(seconds=1), usegmt=True)
+
+    response = client.get('/data/download', params=PARAMS, headers={'If-Modified-Since': older})
+
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_download_if_none_match_takes_priority(client, validators):
+    _, last_modified = validators
+
+    response = client.get('/data/download', params=PARAMS,
+                          headers={'If-None-Match': '"other"', 'If-Modified-Since': last_modified})
+
+    assert response.status_code == 200
+
+
+def test_download_range(client):
+    response = client.get('/data/download', params=PARAMS, headers={'Range': 'bytes=2-9'})
+
+    assert response.status_code == 206
+    assert response.headers['content-range'] == f'bytes 2-9/{len(CONTENT)}'
+    assert response.content == CONTENT[2:10]
+
+
+@pytest.mark.parametrize('if_none_match, if_modified_since, expected', [
+    (None, None, False),
+    ('"a", W/"b"', None, True),
+    ('"c"', 'Mon, 01 Jan 2024 00:00:00 GMT', False),
+    (None, 'not a date', False),
+    (None, 'Sun, 31 Dec 2023 23:59:59 GMT', False),
+    (None, 'Mon, 01 Jan 2024 00:00:01 GMT', True),
+])
+def test_is_not_modified(if_none_match, if_modified_since, expected):
+    assert is_not_modified('"b"', 'Mon, 01 Jan 2024 00:00:00 GMT', if_none_match, if_modified_since) is expected
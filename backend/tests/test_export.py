@@ -0,0 +1,109 @@
+import io
+import tarfile
+import zipfile
+from types import SimpleNamespace
+from urllib.parse import quote
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.apps.data.depends import get_data_service
+from src.apps.data.repositories import DataRepositoryImpl
+from src.apps.data.router import router
+from src.apps.data.services.data import DataServiceImpl
+
+TOKEN = 'abcdef1234567890'
+
+
+class _Factory:
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def make(self):
+        return self.repository
+
+
+class _TrackingRepository:
+    async def get_test_by_token(self, test_token):
+        return SimpleNamespace(name='test') if test_token == TOKEN else None
+
+
+def _write_stage_files(test_dir, stages=3):
+    contents = {}
+    for stage_id in range(1, stages + 1):
+        for name, data in (
+            (f"heatmap_{stage_id}.csv", f"x,y,confidence\n0.5,0.5,{stage_id}\n".encode()),
+            (f"heatmap_first_{stage_id}.csv", f"x,y,time_to_first_fixation\n0.5,0.5,{stage_id}\n".encode()),
+            (f"heatmap_{stage_id}.png", b'\x89PNG' + bytes([stage_id]) * 64),
+        ):
+            (test_dir / name).write_bytes(data)
+            contents[f"{test_dir.name}/{name}"] = data
+    return contents
+
+
+@pytest.fixture
+def make_client(tmp_path):
+    def make(test_dir_name):
+        data_dir = tmp_path / 'data'
+        test_dir = data_dir / test_dir_name
+        test_dir.mkdir(parents=True)
+        contents = _write_stage_files(test_dir)
+
+        app = FastAPI()
+        app.include_router(router)
+        repository = DataRepositoryImpl(str(data_dir))
+        app.dependency_overrides[get_data_service] = lambda: DataServiceImpl(
+            _Factory(repository), _Factory(_TrackingRepository()))
+        return TestClient(app), contents
+    return make
+
+
+def _read_archive(content, archive_format):
+    if archive_format == 'zip':
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            assert archive.testzip() is None
+            return {name: archive.read(name) for name in archive.namelist()}
+    with tarfile.open(fileobj=io.BytesIO(content)) as archive:
+        return {member.name: archive.extractfile(member).read() for member in archive.getmembers()}
+
+
+@pytest.mark.parametrize('archive_format', ['zip', 'tar'])
+@pytest.mark.parametrize('test_dir_name', ['My_Test_abcdef12', 'Мой_тест_abcdef12'])
+def test_export_streams_all_files(make_client, test_dir_name, archive_format):
+    client, contents = make_client(test_dir_name)
+
+    response = client.get('/data/export', params={'test_token': TOKEN, 'format': archive_format})
+
+    assert response.status_code == 200
+    filename = f"{test_dir_name}.{archive_format}"
+    disposition = response.headers['content-disposition']
+    if filename.isascii():
+        assert disposition == f'attachment; filename="{filename}"'
+    else:
+        assert f"filename*=utf-8''{quote(filename)}" in disposition
+    assert _read_archive(response.content, archive_format) == contents
+
+
+def test_export_filters_by_type_and_stage_range(make_client):
+    client, contents = make_client('Мой_тест_abcdef12')
+
+    response = client.get('/data/export', params={
+        'test_token': TOKEN, 'file_type': 'heatmap', 'stage_from': 2, 'stage_to': 3, 'format': 'tar',
+    })
+
+    assert response.status_code == 200
+    expected = {name: data for name, data in contents.items()
+                if name.rsplit('/', 1)[1] in ('heatmap_2.csv', 'heatmap_2.png', 'heatmap_3.csv', 'heatmap_3.png')}
+    assert _read_archive(response.content, 'tar') == expected
+
+
+@pytest.mark.parametrize('params, status_code', [
+    ({'test_token': 'unknown0'}, 404),
+    ({'test_token': TOKEN, 'stage_from': 10}, 404),
+    ({'test_token': TOKEN, 'stage_from': 3, 'stage_to': 1}, 400),
+])
+def test_export_errors(make_client, params, status_code):
+    client, _ = make_client('My_Test_abcdef12')
+
+    assert client.get('/data/export', params=params).status_code == status_code
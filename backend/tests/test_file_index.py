@@ -0,0 +1,81 @@
+import os
+import time
+
+import pytest
+
+from src.apps.data.repositories import file_index
+from src.apps.data.repositories.file_index import DataFileIndex
+
+TOKEN = 'abcdef1234567890'
+
+
+def _age(path, seconds=60):
+    # Каталог старше окна неточности времени: индекс доверяет сохраненному mtime
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def _touch(path):
+    path.write_text('x,y,confidence\n0.5,0.5,1\n')
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    data_dir = tmp_path / 'data'
+    test_dir = data_dir / 'My_Test_abcdef12'
+    test_dir.mkdir(parents=True)
+    _touch(test_dir / 'heatmap_1.csv')
+    _age(test_dir, 120)
+    _age(data_dir, 120)
+    return data_dir
+
+
+def test_get_sees_file_added_on_disk(data_dir):
+    index = DataFileIndex(data_dir)
+    index.ensure_built()
+    assert index.get(TOKEN, 2, 'heatmap') is None
+
+    test_dir = data_dir / 'My_Test_abcdef12'
+    _touch(test_dir / 'heatmap_2.csv')
+    _age(test_dir)
+
+    assert index.get(TOKEN, 2, 'heatmap').path == test_dir / 'heatmap_2.csv'
+    assert [f.stage_id for f in index.list_files(TOKEN, 'heatmap')] == [1, 2]
+
+
+def test_get_drops_file_removed_on_disk(data_dir):
+    index = DataFileIndex(data_dir)
+    assert index.get(TOKEN, 1, 'heatmap') is not None
+
+    test_dir = data_dir / 'My_Test_abcdef12'
+    (test_dir / 'heatmap_1.csv').unlink()
+    _age(test_dir)
+
+    assert index.get(TOKEN, 1, 'heatmap') is None
+    assert index.list_files(TOKEN) == []
+
+
+def test_list_files_sees_new_test_dir(data_dir):
+    index = DataFileIndex(data_dir)
+    assert index.list_files('12345678abcd') == []
+
+    test_dir = data_dir / 'Other_12345678'
+    test_dir.mkdir()
+    _touch(test_dir / 'heatmap_first_1.csv')
+    _age(test_dir)
+    _age(data_dir)
+
+    assert [f.path for f in index.list_files('12345678abcd')] == [test_dir / 'heatmap_first_1.csv']
+
+
+def test_unchanged_dirs_are_not_rescanned(data_dir, monkeypatch):
+    index = DataFileIndex(data_dir)
+    index.ensure_built()
+
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(file_index.os, 'scandir', lambda path: scans.append(path) or scandir(path))
+
+    for _ in range(3):
+        assert index.get(TOKEN, 1, 'heatmap') is not None
+    assert scans == []
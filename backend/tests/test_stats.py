@@ -0,0 +1,162 @@
+import csv
+import statistics
+
+import pytest
+from fastapi import HTTPException
+
+from src.apps.data.repositories.stats import (
+    compute_heatmap_first_stats, compute_heatmap_long_stats, compute_heatmap_stats,
+)
+
+
+# Прежний построчный разбор (csv.DictReader + statistics), с которым сравниваются результаты
+
+def _reference_rows(text, column):
+    lines = text.strip().split('\n')
+    rows = []
+    for row in csv.DictReader(lines):
+        try:
+            rows.append({'x': float(row.get('x', 0)), 'y': float(row.get('y', 0)),
+                         'value': float(row.get(column, 0))})
+        except (ValueError, KeyError):
+            continue
+    return rows
+
+
+def _point(row):
+    return {'x': row['x'], 'y': row['y'], 'value': row['value']}
+
+
+def reference_heatmap_stats(text):
+    rows = _reference_rows(text, 'confidence')
+    max_point = None
+    max_value = 0
+    for row in rows:
+        if row['value'] > max_value:
+            max_value, max_point = row['value'], row
+    if not rows or max_point is None:
+        return None
+    median_row = sorted(rows, key=lambda p: p['value'])[len(rows) // 2]
+    return {
+        'max_point': _point(max_point),
+        'mean_value': statistics.mean(p['value'] for p in rows),
+        'median_point': _point(median_row),
+        'total_points': len(rows),
+    }
+
+
+def _reference_extremes(rows):
+    lowest = highest = None
+    for row in rows:
+        if row['value'] > 0 and (lowest is None or row['value'] < lowest['value']):
+            lowest = row
+        if row['value'] > (highest['value'] if highest else 0):
+            highest = row
+    return lowest, highest
+
+
+def reference_heatmap_first_stats(text):
+    rows = _reference_rows(text, 'time_to_first_fixation')
+    fastest, slowest = _reference_extremes(rows)
+    if fastest is None:
+        return None
+    times = [p['value'] for p in rows if p['value'] > 0]
+    return {
+        'fastest_point': _point(fastest),
+        'slowest_point': _point(slowest),
+        'mean_time': statistics.mean(times),
+        'median_time': statistics.median(times),
+        'total_areas': len(rows),
+    }
+
+
+def reference_heatmap_long_stats(text):
+    rows = _reference_rows(text, 'fixation_duration')
+    shortest, longest = _reference_extremes(rows)
+    if shortest is None:
+        return None
+    durations = [p['value'] for p in rows if p['value'] > 0]
+    return {
+        'longest_point': _point(longest),
+        'shortest_point': _point(shortest),
+        'mean_duration': statistics.mean(durations),
+        'median_duration': statistics.median(durations),
+        'total_fixations': len(durations),
+    }
+
+
+def _flatten(stats):
+    """Плоский словарь для сравнения через pytest.approx (без процентилей - их нет в прежнем расчете)"""
+    flat = {}
+    for key, value in stats.items():
+        if key == 'percentiles':
+            continue
+        if isinstance(value, dict):
+            flat.update({f"{key}.{name}": item for name, item in value.items()})
+        else:
+            flat[key] = value
+    return flat
+
+
+STATS = [
+    ('confidence', compute_heatmap_stats, reference_heatmap_stats),
+    ('time_to_first_fixation', compute_heatmap_first_stats, reference_heatmap_first_stats),
+    ('fixation_duration', compute_heatmap_long_stats, reference_heatmap_long_stats),
+]
+
+CSV_BODIES = {
+    'clean': "0.1,0.2,3\n0.5,0.5,7\n0.9,0.1,1\n0.3,0.3,0\n",
+    'blank_value': "0.1,0.2,3\n0.5,0.5,\n0.9,0.1,1\n0.4,0.4,8\n",
+    'blank_coordinate': "0.1,0.2,3\n,0.5,7\n0.9,0.1,1\n0.4,0.4,8\n",
+    'malformed': "0.1,0.2,3\nbad,0.5,7\n0.9,0.1,oops\n0.4,0.4,8\n0.6,0.6,2\n",
+    'ties': "0.1,0.1,5\n0.2,0.2,5\n0.3,0.3,1\n0.4,0.4,5\n0.5,0.5,9\n0.6,0.6,5\n",
+    'blank_lines': "0.1,0.2,3\n\n0.5,0.5,7\n\n0.9,0.1,1\n\n",
+    'many_ties': ''.join(f"{i / 1000},{i / 2000},{i * 7 % 5}\n" for i in range(1001)),
+}
+
+
+@pytest.mark.parametrize('body', CSV_BODIES.values(), ids=CSV_BODIES.keys())
+@pytest.mark.parametrize('column, compute, reference', STATS, ids=[column for column, _, _ in STATS])
+def test_stats_match_row_by_row_parser(tmp_path, body, column, compute, reference):
+    text = f"x,y,{column}\n{body}"
+    file_path = tmp_path / 'stage.csv'
+    file_path.write_text(text, encoding='utf-8')
+
+    assert _flatten(compute(file_path)) == pytest.approx(_flatten(reference(text)))
+
+
+@pytest.mark.parametrize('column, compute, reference', STATS, ids=[column for column, _, _ in STATS])
+def test_missing_coordinate_column_is_zero(tmp_path, column, compute, reference):
+    text = f"y,{column}\n0.2,3\n0.5,7\n0.1,,\n"
+    file_path = tmp_path / 'stage.csv'
+    file_path.write_text(text, encoding='utf-8')
+
+    assert _flatten(compute(file_path)) == pytest.approx(_flatten(reference(text)))
+
+
+def test_short_rows_are_skipped(tmp_path):
+    file_path = tmp_path / 'heatmap_1.csv'
+    file_path.write_text("x,y,confidence\n0.1,0.2,3\n0.5,0.5\n0.9,0.1,1\n", encoding='utf-8')
+
+    result = compute_heatmap_stats(file_path)
+    assert result['total_points'] == 2
+    assert result['mean_value'] == pytest.approx(2.0)
+
+
+@pytest.mark.parametrize('text', ["", "x,y,confidence\n", "x,y,confidence\n\n\n"])
+def test_empty_csv_is_rejected(tmp_path, text):
+    file_path = tmp_path / 'heatmap_1.csv'
+    file_path.write_text(text, encoding='utf-8')
+
+    with pytest.raises(HTTPException) as error:
+        compute_heatmap_stats(file_path)
+    assert error.value.status_code == 400
+
+
+def test_no_valid_rows_is_rejected(tmp_path):
+    file_path = tmp_path / 'heatmap_1.csv'
+    file_path.write_text("x,y,confidence\n0.1,0.2,\n0.5,0.5,bad\n", encoding='utf-8')
+
+    with pytest.raises(HTTPException) as error:
+        compute_heatmap_stats(file_path)
+    assert error.value.status_code == 400
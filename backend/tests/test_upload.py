@@ -0,0 +1,145 @@
+import hashlib
+import io
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.testclient import TestClient
+
+from src.apps.data.depends import get_data_service
+from src.apps.data.repositories import DataRepositoryImpl
+from src.apps.data.repositories import data as data_module
+from src.apps.data.router import router
+from src.apps.data.services.data import DataServiceImpl
+
+TOKEN = 'abcdef1234567890'
+CONTENT = b'x,y,confidence\n' + b'0.5,0.5,1\n' * 20
+
+
+class _Factory:
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def make(self):
+        return self.repository
+
+
+class _TrackingRepository:
+    async def get_test_by_token(self, test_token):
+        return SimpleNamespace(name='test') if test_token == TOKEN else None
+
+    async def get_stage_by_id(self, test_token, stage_id):
+        return SimpleNamespace(id=stage_id)
+
+
+@pytest.fixture
+def repository(tmp_path):
+    # Маленький блок, чтобы загрузка записывалась за несколько итераций
+    return DataRepositoryImpl(str(tmp_path / 'data'), max_upload_size=len(CONTENT), upload_chunk_size=16)
+
+
+@pytest.fixture
+def client(repository):
+    app = FastAPI()
+    app.include_router(router)
+    app.dependency_overrides[get_data_service] = lambda: DataServiceImpl(
+        _Factory(repository), _Factory(_TrackingRepository()))
+    return TestClient(app)
+
+
+def _upload(client, content, filename='heatmap_1.csv'):
+    return client.post('/data/upload', data={'test_token': TOKEN, 'stage_id': 1},
+                       files={'file': (filename, content, 'text/csv')})
+
+
+def _test_dir_files(repository):
+    return sorted(path.name for path in repository.base_data_dir.glob('*/*'))
+
+
+def test_upload_returns_checksum(client, repository):
+    response = _upload(client, CONTENT)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body['file_size'] == len(CONTENT)
+    assert body['checksum'] == hashlib.sha256(CONTENT).hexdigest()
+    assert (repository.base_data_dir / 'test_abcdef12' / 'heatmap_1.csv').read_bytes() == CONTENT
+
+
+def test_upload_too_large_is_rejected(client, repository):
+    response = _upload(client, CONTENT + b'0.5,0.5,2\n')
+
+    assert response.status_code == 413
+    assert _test_dir_files(repository) == []
+
+
+@pytest.mark.asyncio
+async def test_upload_limit_checked_while_streaming(repository):
+    # Размер заранее неизвестен: лимит срабатывает во время записи
+    file = UploadFile(io.BytesIO(CONTENT + b'0.5,0.5,2\n'), filename='heatmap_1.csv')
+    assert file.size is None
+
+    with pytest.raises(HTTPException) as error:
+        await repository.save_data_file(file, TOKEN, 1, 'test')
+
+    assert error.value.status_code == 413
+    assert _test_dir_files(repository) == []
+
+
+@pytest.mark.asyncio
+async def test_upload_write_failure_keeps_previous_file(repository, monkeypatch):
+    target = repository.base_data_dir / 'test_abcdef12' / 'heatmap_1.csv'
+    target.parent.mkdir(parents=True)
+    target.write_bytes(b'old')
+
+    written = []
+
+    def failing_write(target_file, digest, chunk):
+        if written:
+            raise OSError('disk full')
+        written.append(chunk)
+        target_file.write(chunk)
+
+    monkeypatch.setattr(DataRepositoryImpl, '_write_chunk', staticmethod(failing_write))
+
+    with pytest.raises(OSError):
+        await repository.save_data_file(UploadFile(io.BytesIO(CONTENT), filename='heatmap_1.csv'), TOKEN, 1, 'test')
+
+    assert target.read_bytes() == b'old'
+    assert _test_dir_files(repository) == ['heatmap_1.csv']
+
+
+@pytest.mark.asyncio
+async def test_upload_replaces_target_atomically(repository, monkeypatch):
+    target = repository.base_data_dir / 'test_abcdef12' / 'heatmap_1.csv'
+    target.parent.mkdir(parents=True)
+    target.write_bytes(b'old')
+
+    seen_during_write = []
+    write_chunk = DataRepositoryImpl._write_chunk
+
+    def observing_write(target_file, digest, chunk):
+        # Пока загрузка пишется, читатели видят прежний файл целиком
+        seen_during_write.append(target.read_bytes())
+        write_chunk(target_file, digest, chunk)
+
+    replaced = []
+    replace = data_module.os.replace
+
+    def observing_replace(source, destination):
+        replaced.append((source.name, destination))
+        replace(source, destination)
+
+    monkeypatch.setattr(DataRepositoryImpl, '_write_chunk', staticmethod(observing_write))
+    monkeypatch.setattr(data_module.os, 'replace', observing_replace)
+
+    saved = await repository.save_data_file(UploadFile(io.BytesIO(CONTENT), filename='heatmap_1.csv'), TOKEN, 1, 'test')
+
+    assert len(seen_during_write) > 1 and set(seen_during_write) == {b'old'}
+    assert len(replaced) == 1
+    source_name, destination = replaced[0]
+    assert source_name.startswith('.heatmap_1.csv.') and source_name.endswith('.part')
+    assert destination == target
+    assert target.read_bytes() == CONTENT
+    assert saved.checksum == hashlib.sha256(CONTENT).hexdigest()
+    assert _test_dir_files(repository) == ['heatmap_1.csv']
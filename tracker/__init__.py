@@ -3,5 +3,9 @@
 """
 
 from .gazepoint_tracker import GazepointTracker
+from .async_tracker import AsyncGazepointTracker, record_many
+from .record_parser import RecordStreamParser
+from .sample_buffer import SampleBuffer
+from .live_heatmap import LiveHeatmap
 
-__all__ = ['GazepointTracker'] 
\ No newline at end of file
+__all__ = ['GazepointTracker', 'AsyncGazepointTracker', 'record_many', 'RecordStreamParser', 'SampleBuffer', 'LiveHeatmap']
\ No newline at end of file
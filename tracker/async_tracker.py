@@ -0,0 +1,204 @@
+"""
+Асинхронный клиент Gazepoint Open Gaze API.
+
+Позволяет одному процессу вести запись с нескольких серверов Gazepoint
+одновременно: чтение сокетов выполняется в одном цикле asyncio, без пары
+потоков на каждый трекер и без опроса с таймаутом.
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from .fixations import FIXATION_COLUMNS, FixationRecorder
+from .protocol import DEFAULT_FIELDS, apply_ack, build_set_commands, resolve_fields
+from .record_parser import RecordStreamParser
+from .sample_buffer import SampleBuffer
+
+
+class AsyncGazepointTracker:
+    def __init__(self, host='127.0.0.1', port=4242, name=None, recv_size=65536,
+                 chunk_size=1024, timing='device', executor: Optional[Executor] = None,
+                 fields=DEFAULT_FIELDS, ack_timeout=1.0, fixation_source='bpog', output_format='csv'):
+        """
+        Инициализация асинхронного клиента Gazepoint
+        :param host: IP адрес сервера Gazepoint
+        :param port: Порт сервера Gazepoint
+        :param name: Имя трекера в именах файлов (по умолчанию host_port)
+        :param recv_size: Размер одного чтения из сокета в байтах
+        :param chunk_size: Количество записей в блоке, который сбрасывается на диск
+        :param timing: Источник времени для T и Tn: 'device' или 'wall'
+        :param executor: Общий однопоточный executor для записи файлов
+        :param fields: Поля, которые включаются при настройке (см. protocol.FIELD_IDS)
+        :param ack_timeout: Время ожидания подтверждений настройки в секундах
+        :param fixation_source: 'bpog' - фиксации по смещению Best POG, 'fpog' - фиксации трекера
+        :param output_format: Формат файла данных: 'csv' или 'npy'
+        """
+        self.host = host
+        self.port = port
+        self.name = name or f"{host}_{port}"
+        self.recv_size = recv_size
+        self.chunk_size = chunk_size
+        self.output_format = output_format
+        self.executor = executor
+        self.fields = tuple(fields)
+        if fixation_source == 'fpog' and 'pog_fix' not in self.fields:
+            self.fields += ('pog_fix',)
+        self.ack_timeout = ack_timeout
+
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.connected = False
+
+        self.parser = RecordStreamParser()
+        self.recorder = FixationRecorder(timing, source=fixation_source)
+        self.samples: Optional[SampleBuffer] = None
+        self.csv_filename = ""
+        self._record_task: Optional[asyncio.Task] = None
+
+    async def connect(self) -> bool:
+        """Подключение к серверу Gazepoint"""
+        try:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            self.connected = True
+            print(f"✓ [{self.name}] Подключено к Gazepoint сервер на {self.host}:{self.port}")
+            return True
+        except OSError as e:
+            print(f"✗ [{self.name}] Ошибка подключения: {e}")
+            return False
+
+    async def disconnect(self):
+        """Отключение от сервера"""
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+            self.connected = False
+            print(f"✓ [{self.name}] Отключено от сервера Gazepoint")
+
+    async def send_command(self, command: str):
+        """Отправка XML команды на сервер"""
+        self.writer.write(f"{command}\r\n".encode('utf-8'))
+        await self.writer.drain()
+
+    async def configure_tracker(self, fields=None, timeout=None) -> Dict[str, str]:
+        """
+        Настройка трекера: включение полей и ожидание подтверждений ACK
+        :return: Неприменённые настройки {ID: причина}
+        """
+        pending = resolve_fields(self.fields if fields is None else fields)
+        failed: Dict[str, str] = {}
+        self.writer.write(build_set_commands(pending))
+        await self.writer.drain()
+
+        async def wait_acks():
+            async for tag, attrs in self.stream():
+                apply_ack(pending, failed, tag, attrs)
+                if not pending:
+                    return
+
+        try:
+            await asyncio.wait_for(wait_acks(), self.ack_timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            pass
+        for setting_id in pending:
+            failed[setting_id] = "нет подтверждения"
+        for setting_id, reason in failed.items():
+            print(f"⚠️ [{self.name}] Настройка {setting_id} не применена: {reason}")
+        return failed
+
+    async def stream(self) -> AsyncIterator[Tuple[str, Dict[str, str]]]:
+        """Поток разобранных сообщений (тег, атрибуты) до закрытия соединения"""
+        while True:
+            data = await self.reader.read(self.recv_size)
+            if not data:
+                print(f"✗ [{self.name}] Сервер Gazepoint закрыл соединение")
+                self.connected = False
+                return
+            for message in self.parser.feed(data):
+                yield message
+
+    async def record(self, duration: Optional[float] = None) -> str:
+        """
+        Запись фиксаций в CSV до истечения duration секунд или вызова stop()
+        :return: Путь к сохраненному файлу
+        """
+        await self.configure_tracker()
+
+        os.makedirs("data/raw", exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.csv_filename = f"data/raw/gaze_data_{timestamp}_{self.name}.{self.output_format}"
+        self.samples = SampleBuffer(
+            self.csv_filename, FIXATION_COLUMNS, chunk_size=self.chunk_size, executor=self.executor,
+            file_format=self.output_format,
+            metadata={'host': self.host, 'port': self.port, 'started': datetime.now().isoformat()},
+        )
+        self.parser.reset()
+        self.recorder.reset(self.samples)
+
+        await self.send_command('<SET ID="ENABLE_SEND_DATA" STATE="1" />')
+        print(f"🎯 [{self.name}] Начат сбор данных: {self.csv_filename}")
+
+        self._record_task = asyncio.ensure_future(self._consume())
+        try:
+            await asyncio.wait({self._record_task}, timeout=duration)
+        finally:
+            if not self._record_task.done():
+                self._record_task.cancel()
+            try:
+                await self._record_task
+            except asyncio.CancelledError:
+                pass
+            self._record_task = None
+            if self.connected:
+                await self.send_command('<SET ID="ENABLE_SEND_DATA" STATE="0" />')
+            self.recorder.finish()
+            self.samples.metadata.update(self.recorder.summary(), **self.parser.stats())
+            # Закрытие дожидается записи последнего блока, не блокируя цикл событий
+            await asyncio.to_thread(self.samples.close)
+
+        stats = self.parser.stats()
+        print(f"⏹️ [{self.name}] Сохранено {len(self.samples)} записей в {self.csv_filename} "
+              f"(поврежденных сообщений: {stats['malformed']}, потерянных пакетов: {self.recorder.lost_packets})")
+        return self.csv_filename
+
+    def stop(self):
+        """Прерывает текущую запись"""
+        if self._record_task is not None:
+            self._record_task.cancel()
+
+    async def _consume(self):
+        async for tag, attrs in self.stream():
+            if tag == 'REC':
+                try:
+                    self.recorder.process(attrs)
+                except ValueError:
+                    self.parser.malformed += 1
+
+
+async def record_many(addresses: Sequence[Tuple[str, int]], duration: float,
+                      **tracker_options) -> List[Optional[str]]:
+    """
+    Одновременная запись с нескольких серверов Gazepoint в одном процессе
+    :param addresses: Список пар (host, port)
+    :param duration: Длительность записи в секундах
+    :return: Пути к файлам (None для трекеров, к которым не удалось подключиться)
+    """
+    # Один поток записи на все трекеры
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        trackers = [AsyncGazepointTracker(host, port, executor=executor, **tracker_options)
+                    for host, port in addresses]
+
+        async def run(tracker: AsyncGazepointTracker) -> Optional[str]:
+            if not await tracker.connect():
+                return None
+            try:
+                return await tracker.record(duration)
+            finally:
+                await tracker.disconnect()
+
+        return list(await asyncio.gather(*(run(tracker) for tracker in trackers)))
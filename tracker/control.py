@@ -0,0 +1,179 @@
+"""
+Локальный канал управления трекером.
+
+Команды передаются одной строкой через TCP-сокет на 127.0.0.1,
+ответ возвращается одной строкой. Поток сервера ждет событий в select()
+без таймаута, поэтому в простое не расходует процессор, а команда
+обрабатывается сразу после получения.
+
+Пример: python -m tracker.control finish
+"""
+
+import selectors
+import socket
+import sys
+import threading
+from typing import Callable, Optional
+
+CONTROL_HOST = '127.0.0.1'
+CONTROL_PORT = 4243
+
+
+class ControlServer:
+    """Сервер команд управления, работающий в отдельном потоке"""
+
+    def __init__(self, handler: Callable[[str, str], str],
+                 host: str = CONTROL_HOST, port: int = CONTROL_PORT):
+        """
+        :param handler: Обработчик (команда, аргументы) -> строка ответа
+        :param host: Адрес для прослушивания (только локальный)
+        :param port: Порт для прослушивания
+        """
+        self.handler = handler
+        self.host = host
+        self.port = port
+        # Объекты текущего запуска; поток цикла получает свои копии при старте
+        # и закрывает только их, даже если сервер уже перезапущен
+        self._listener: Optional[socket.socket] = None
+        self._selector: Optional[selectors.BaseSelector] = None
+        self._wakeup_w: Optional[socket.socket] = None
+        self._stopping: Optional[threading.Event] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Открывает сокет и запускает поток обработки команд"""
+        if self._thread is not None:
+            return
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen()
+        listener.setblocking(False)
+
+        # Пара сокетов для пробуждения select() при остановке
+        wakeup_r, wakeup_w = socket.socketpair()
+        wakeup_r.setblocking(False)
+
+        selector = selectors.DefaultSelector()
+        selector.register(listener, selectors.EVENT_READ, lambda sock: self._accept(sock, selector))
+        selector.register(wakeup_r, selectors.EVENT_READ, None)
+
+        self._listener, self._selector, self._wakeup_w = listener, selector, wakeup_w
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._loop, args=(selector, (listener, wakeup_r, wakeup_w), self._stopping), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает сервер (можно вызывать из обработчика команды)"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._thread = None
+        self._stopping.set()
+        try:
+            self._wakeup_w.send(b'\0')
+        except OSError:
+            pass
+        if thread is not threading.current_thread():
+            thread.join()
+        else:
+            # Остановка из обработчика: порт освобождается сразу, чтобы новый
+            # start() мог его занять, остальное закроет завершающийся цикл
+            try:
+                self._selector.unregister(self._listener)
+            except (KeyError, ValueError):
+                pass
+            self._listener.close()
+
+    @staticmethod
+    def _loop(selector: selectors.BaseSelector, sockets, stopping: threading.Event):
+        try:
+            while not stopping.is_set():
+                for key, _ in selector.select():
+                    if key.data is None:
+                        # Сигнал остановки
+                        key.fileobj.recv(64)
+                    else:
+                        key.data(key.fileobj)
+        finally:
+            for sock in sockets:
+                sock.close()
+            selector.close()
+
+    def _accept(self, listener: socket.socket, selector: selectors.BaseSelector):
+        try:
+            conn, _ = listener.accept()
+        except OSError:
+            # Нет ожидающего соединения или сокет уже закрыт командой остановки
+            return
+        conn.setblocking(False)
+        selector.register(conn, selectors.EVENT_READ, self._make_reader(conn, selector))
+
+    def _make_reader(self, conn: socket.socket, selector: selectors.BaseSelector):
+        buffer = bytearray()
+
+        def read(_):
+            try:
+                chunk = conn.recv(1024)
+            except BlockingIOError:
+                return
+            except OSError:
+                chunk = b''
+            if chunk:
+                buffer.extend(chunk)
+                if b'\n' not in buffer:
+                    return
+            line = buffer.split(b'\n', 1)[0].decode('utf-8', errors='replace').strip()
+            selector.unregister(conn)
+            reply = self._dispatch(line) if line else "error: пустая команда"
+            try:
+                conn.setblocking(True)
+                conn.sendall(reply.encode('utf-8') + b'\n')
+            except OSError:
+                pass
+            finally:
+                conn.close()
+
+        return read
+
+    def _dispatch(self, line: str) -> str:
+        command, _, args = line.partition(' ')
+        try:
+            return self.handler(command.lower(), args.strip())
+        except Exception as e:
+            return f"error: {e}"
+
+
+def send_control_command(command: str, host: str = CONTROL_HOST, port: int = CONTROL_PORT,
+                         timeout: float = 5.0) -> str:
+    """
+    Отправляет команду запущенному трекеру и возвращает ответ
+    :param command: Строка команды, например 'status' или 'mark клик по кнопке'
+    """
+    with socket.create_connection((host, port), timeout=timeout) as conn:
+        conn.sendall(command.strip().encode('utf-8') + b'\n')
+        reply = bytearray()
+        while True:
+            chunk = conn.recv(1024)
+            if not chunk:
+                break
+            reply.extend(chunk)
+    return reply.decode('utf-8').strip()
+
+
+def main():
+    """Отправка команды из командной строки"""
+    if len(sys.argv) < 2:
+        print("Использование: python -m tracker.control <stop|finish|status|pause|resume|heatmap|mark ТЕКСТ>")
+        return 1
+    try:
+        print(send_control_command(' '.join(sys.argv[1:])))
+    except OSError as e:
+        print(f"✗ Трекер не отвечает на {CONTROL_HOST}:{CONTROL_PORT}: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
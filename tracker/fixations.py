@@ -0,0 +1,232 @@
+import csv
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .sample_buffer import SampleBuffer
+
+# Колонки файла с фиксациями
+FIXATION_COLUMNS = ('x', 'y', 'T', 'Tn', 'lost')
+
+
+class FixationRecorder:
+    """
+    Выделение фиксаций из записей REC и их сохранение в SampleBuffer.
+
+    В режиме source='bpog' фиксация считается завершенной, когда точка
+    Best POG смещается дальше position_threshold. В режиме source='fpog'
+    используются фиксации, выделенные самим трекером (FPOGX/FPOGY/FPOGS/
+    FPOGD/FPOGID): строка пишется один раз на каждый FPOGID с длительностью
+    от устройства. Для каждой фиксации сохраняются координаты, время
+    окончания от начала записи T, длительность Tn и число пакетов,
+    потерянных за время фиксации. Общий код для синхронного и асинхронного клиентов.
+    """
+
+    def __init__(self, timing: str = 'device', position_threshold: float = 0.01, source: str = 'bpog'):
+        """
+        :param timing: Источник времени для T и Tn: 'device' - поле TIME трекера, 'wall' - часы компьютера
+        :param position_threshold: Порог для определения "одинаковых" позиций
+        :param source: Источник фиксаций: 'bpog' - по смещению Best POG, 'fpog' - фиксации трекера
+        """
+        if timing not in ('device', 'wall'):
+            raise ValueError(f"Неизвестный режим времени: {timing}")
+        if source not in ('bpog', 'fpog'):
+            raise ValueError(f"Неизвестный источник фиксаций: {source}")
+        # Фиксации трекера всегда измеряются по его часам
+        self.timing = 'device' if source == 'fpog' else timing
+        self.source = source
+        self.position_threshold = position_threshold
+        self.samples: Optional[SampleBuffer] = None
+        # Получатель каждой записанной фиксации (x, y, T, Tn, lost), например LiveHeatmap.add
+        self.on_fixation: Optional[Callable[[float, float, float, float, int], None]] = None
+        self.reset(None)
+
+    def reset(self, samples: Optional[SampleBuffer]):
+        """Начинает новую сессию записи в указанный буфер"""
+        self.samples = samples
+        # В режиме 'device' отсчет начинается с первой записи от трекера
+        self.start_time = time.time() * 1000 if self.timing == 'wall' else None  # в миллисекундах
+        self.last_time = self.start_time
+        self.latest_time = self.start_time  # Время последней полученной записи (мс)
+        self.last_x = None
+        self.last_y = None
+
+        # Текущая фиксация трекера в режиме 'fpog'
+        self.fixation_id = None
+        self.fixation_start = 0.0  # FPOGS, мс
+        self.fixation_duration = 0.0  # FPOGD, мс
+        self._flushed_id = None  # Фиксация, уже записанная при постановке на паузу
+
+        # Контроль потерянных пакетов по счетчику CNT
+        self.last_counter = None
+        self.lost_packets = 0
+        self.fixation_lost = 0  # Потери внутри текущей фиксации
+
+        self.paused = False
+        self._pause_seen = False
+        self.events: List[Tuple[float, str]] = []  # Отметки событий (T, описание)
+
+    def current_time(self) -> float:
+        """Текущее время сессии в мс по выбранному источнику времени"""
+        if self.timing == 'wall':
+            return time.time() * 1000
+        return self.latest_time
+
+    def elapsed(self) -> float:
+        """Время от начала записи в мс"""
+        if self.start_time is None:
+            return 0.0
+        return self.current_time() - self.start_time
+
+    def process(self, attrs: Dict[str, str]):
+        """
+        Обработка атрибутов отдельной записи REC
+        :raises ValueError: Если в записи некорректные числовые значения
+        """
+        # Проверяем непрерывность счетчика пакетов
+        counter = attrs.get('CNT')
+        if counter:
+            self._check_counter(int(counter))
+
+        # Извлекаем атрибуты
+        time_val = attrs.get('TIME')
+        bpogx = attrs.get('BPOGX')
+        bpogy = attrs.get('BPOGY')
+        bpogv = attrs.get('BPOGV')
+
+        if time_val and self.timing == 'device':
+            self.latest_time = float(time_val) * 1000
+            if self.start_time is None:
+                self.start_time = self.latest_time
+                self.last_time = self.latest_time
+
+        # На паузе завершаем текущую фиксацию и не создаем новых записей
+        if self.paused:
+            if not self._pause_seen:
+                self.finish()
+                self._pause_seen = True
+            return
+        if self._pause_seen:
+            # После паузы отсчет длительности начинается заново
+            self.last_time = self.current_time()
+            self._pause_seen = False
+
+        if self.source == 'fpog':
+            self._process_device_fixation(attrs)
+            return
+
+        # Обрабатываем только если есть данные Best POG
+        if time_val and bpogx and bpogy and bpogv:
+            current_x = float(bpogx)
+            current_y = float(bpogy)
+            is_valid = bpogv == "1"
+
+            # Учитываем только валидные данные
+            if is_valid and current_x > 0 and current_y > 0:
+                # Проверяем, изменилась ли позиция
+                if not self._is_same_position(current_x, current_y, self.last_x, self.last_y):
+                    # Новая позиция - сохраняем предыдущую фиксацию (если была)
+                    self.close_fixation(self.current_time())
+
+                    # Начинаем новую фиксацию
+                    self.last_x = current_x
+                    self.last_y = current_y
+
+                # Если позиция та же, просто продолжаем фиксацию (не создаем запись)
+
+    def close_fixation(self, current_time_ms: float):
+        """Записывает текущую фиксацию, завершившуюся в момент current_time_ms"""
+        if self.last_x is None or self.last_y is None:
+            return
+        T = current_time_ms - self.start_time
+        Tn = current_time_ms - self.last_time
+        self._emit(self.last_x, self.last_y, T, Tn, self.fixation_lost)
+        self.last_time = current_time_ms
+        self.fixation_lost = 0
+
+    def _process_device_fixation(self, attrs: Dict[str, str]):
+        """Обработка полей FPOG: строка пишется при смене FPOGID"""
+        fixation_id = attrs.get('FPOGID')
+        if not fixation_id:
+            return
+        fixation_id = int(fixation_id)
+        if fixation_id == self._flushed_id:
+            return
+        if fixation_id != self.fixation_id:
+            self.close_device_fixation()
+            self.fixation_id = fixation_id
+
+        if attrs.get('FPOGV') == "1":
+            x = float(attrs['FPOGX'])
+            y = float(attrs['FPOGY'])
+            if x > 0 and y > 0:
+                self.last_x = x
+                self.last_y = y
+                self.fixation_start = float(attrs['FPOGS']) * 1000
+                self.fixation_duration = float(attrs['FPOGD']) * 1000
+
+    def close_device_fixation(self):
+        """Записывает фиксацию трекера с ее собственными началом и длительностью"""
+        if self.last_x is None or self.last_y is None:
+            return
+        T = self.fixation_start + self.fixation_duration - self.start_time
+        self._emit(self.last_x, self.last_y, T, self.fixation_duration, self.fixation_lost)
+        self.fixation_lost = 0
+        self.last_x = None
+        self.last_y = None
+
+    def finish(self):
+        """Сохраняет последнюю незавершенную фиксацию"""
+        if self.source == 'fpog':
+            self.close_device_fixation()
+            self._flushed_id = self.fixation_id
+            return
+        self.close_fixation(self.current_time())
+        self.last_x = None
+        self.last_y = None
+
+    def summary(self) -> Dict[str, object]:
+        """Параметры и итоги сессии для метаданных записи"""
+        return {
+            'timing': self.timing,
+            'fixation_source': self.source,
+            'lost_packets': self.lost_packets,
+            'duration_ms': self.elapsed(),
+        }
+
+    def mark(self, label: str) -> float:
+        """Добавляет отметку события, возвращает ее время T в мс"""
+        T = self.elapsed()
+        self.events.append((T, label))
+        return T
+
+    def save_events(self, filename: str) -> int:
+        """Сохраняет отметки событий в CSV, возвращает их количество"""
+        if not self.events:
+            return 0
+        with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(['T', 'event'])
+            writer.writerows(self.events)
+        return len(self.events)
+
+    def _emit(self, x, y, T, Tn, lost):
+        """Записывает строку фиксации и передает ее получателю on_fixation"""
+        self.samples.append(x, y, T, Tn, lost)
+        if self.on_fixation is not None:
+            self.on_fixation(x, y, T, Tn, lost)
+
+    def _is_same_position(self, x1, y1, x2, y2):
+        """Проверяет, находятся ли две точки в одной позиции (в пределах порога)"""
+        if x2 is None or y2 is None:
+            return False
+        distance = math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
+        return distance < self.position_threshold
+
+    def _check_counter(self, counter):
+        """Учитывает пропуски в счетчике пакетов CNT"""
+        if self.last_counter is not None and counter > self.last_counter + 1:
+            gap = counter - self.last_counter - 1
+            self.lost_packets += gap
+            self.fixation_lost += gap
+        self.last_counter = counter
@@ -2,49 +2,87 @@ import httpx
 import socket
 import threading
 import time
-import xml.etree.ElementTree as ET
 from datetime import datetime
 import sys
-import csv
 import os
-import math
-from typing import Optional, List, Tuple
+from typing import Optional
+
+from .record_parser import RecordStreamParser
+from .sample_buffer import SampleBuffer
+from .fixations import FixationRecorder, FIXATION_COLUMNS
+from .status_reporter import StatusReporter
+from .control import ControlServer, CONTROL_PORT
+from .live_heatmap import LiveHeatmap
+from .protocol import DEFAULT_FIELDS, apply_ack, build_set_commands, resolve_fields
 
 
 class GazepointTracker:
-    def __init__(self, host='127.0.0.1', port=4242):
+    def __init__(self, host='127.0.0.1', port=4242, recv_size=65536, chunk_size=1024,
+                 status_interval=1.0, timing='device', control_port=CONTROL_PORT,
+                 fields=DEFAULT_FIELDS, ack_timeout=1.0, fixation_source='bpog', output_format='csv',
+                 live_heatmap=False, live_half_life=None, live_interval=0.5):
         """
         Инициализация трекера Gazepoint
         :param host: IP адрес сервера Gazepoint (по умолчанию localhost)
         :param port: Порт сервера Gazepoint (по умолчанию 4242)
+        :param recv_size: Размер одного чтения из сокета в байтах
+        :param chunk_size: Количество записей в блоке, который сбрасывается на диск
+        :param status_interval: Период вывода статуса в консоль в секундах (None или 0 - без вывода)
+        :param timing: Источник времени для T и Tn: 'device' - поле TIME трекера, 'wall' - часы компьютера
+        :param control_port: Локальный порт канала управления (python -m tracker.control)
+        :param fields: Поля, которые включаются при настройке (см. protocol.FIELD_IDS)
+        :param ack_timeout: Время ожидания подтверждений настройки в секундах
+        :param fixation_source: 'bpog' - фиксации по смещению Best POG,
+            'fpog' - готовые фиксации трекера (одна строка на FPOGID, длительность от устройства)
+        :param output_format: Формат файла данных: 'csv' или 'npy' (двоичный, с метаданными в .json)
+        :param live_heatmap: Публиковать тепловую карту во время записи в data/live/heatmap_live.npy
+        :param live_half_life: Период полузатухания живой карты в секундах (None - накопительная)
+        :param live_interval: Период публикации живой карты в секундах
         """
         self.host = host
         self.port = port
+        self.recv_size = recv_size
+        self.fields = tuple(fields)
+        if fixation_source == 'fpog' and 'pog_fix' not in self.fields:
+            self.fields += ('pog_fix',)
+        self.ack_timeout = ack_timeout
         self.socket: Optional[socket.socket] = None
         self.connected = False
         self.tracking = False
         self.data_thread = None
-        self.control_thread = None
+        self.stop_timer: Optional[threading.Timer] = None
         self.stop_flag = threading.Event()
         
-        # Данные для CSV
-        self.csv_data: List[Tuple[float, float, float, float]] = []
-        self.start_time = 0.0
-        self.last_time = 0.0
-        self.last_x = None
-        self.last_y = None
-        self.position_threshold = 0.01  # Порог для определения "одинаковых" позиций
-        self.current_fixation_start = 0.0
+        # Потоковый разбор сообщений (сохраняет неполные записи между чтениями)
+        self.parser = RecordStreamParser()
+        
+        # Данные для CSV (пишутся на диск блоками по chunk_size записей)
+        self.chunk_size = chunk_size
+        self.output_format = output_format
+        self.samples: Optional[SampleBuffer] = None
+        
+        # Выделение фиксаций, учет времени и потерянных пакетов
+        self.recorder = FixationRecorder(timing, source=fixation_source)
+        
+        # Живая тепловая карта, обновляемая каждой записанной фиксацией
+        self.live_heatmap: Optional[LiveHeatmap] = None
+        if live_heatmap:
+            self.live_heatmap = LiveHeatmap("data/live/heatmap_live.npy", half_life=live_half_life,
+                                            interval=live_interval)
+            self.recorder.on_fixation = self.live_heatmap.add
         
         # Файл для сохранения
         self.csv_filename = ""
         
+        # Вывод статуса в консоль из отдельного потока
+        self.reporter = StatusReporter(self._status_line, status_interval)
+        
         # Настройки автоматического завершения
         self.max_duration = None  # Максимальная продолжительность в секундах
         self.tracking_start_time = 0.0
         
-        # Файл команд для внешнего управления
-        self.command_file = "tracker_commands.txt"
+        # Канал команд для внешнего управления
+        self.control = ControlServer(self._handle_control_command, port=control_port)
         
     def connect(self):
         """Подключение к серверу Gazepoint"""
@@ -80,38 +118,72 @@ class GazepointTracker:
             return False
     
     def receive_data(self):
-        """Получение данных от сервера"""
+        """Получение сырых байт от сервера"""
         if not self.connected or not self.socket:
             return None
             
         try:
             # Получаем данные с таймаутом
             self.socket.settimeout(1.0)
-            data = self.socket.recv(1024).decode('utf-8')
-            return data.strip()
+            data = self.socket.recv(self.recv_size)
+            if not data:
+                print("✗ Сервер Gazepoint закрыл соединение")
+                self.connected = False
+                return None
+            return data
         except socket.timeout:
             return None
         except Exception as e:
             print(f"✗ Ошибка получения данных: {e}")
             return None
     
-    def configure_tracker(self):
-        """Настройка трекера для получения данных Best POG и времени"""
+    def configure_tracker(self, fields=None, timeout=None):
+        """
+        Настройка трекера: включение полей и ожидание подтверждений ACK
+        :param fields: Поля для включения (по умолчанию заданные в конструкторе)
+        :param timeout: Время ожидания подтверждений в секундах
+        :return: Неприменённые настройки {ID: причина}
+        """
         print("⚙️ Настройка трекера...")
+        pending = resolve_fields(self.fields if fields is None else fields)
+        failed = {}
+        timeout = self.ack_timeout if timeout is None else timeout
         
-        # Включаем отправку времени
-        self.send_command('<SET ID="ENABLE_SEND_TIME" STATE="1" />')
-        time.sleep(0.1)
+        # Отправляем все команды одним пакетом, без пауз между ними
+        try:
+            self.socket.sendall(build_set_commands(pending))
+        except Exception as e:
+            print(f"✗ Ошибка отправки команды: {e}")
+            return {setting_id: "не отправлено" for setting_id in pending}
         
-        # Включаем счетчик пакетов
-        self.send_command('<SET ID="ENABLE_SEND_COUNTER" STATE="1" />')
-        time.sleep(0.1)
+        # Ждем подтверждения, пока не придут все или не истечет таймаут
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self.socket.settimeout(remaining)
+                data = self.socket.recv(self.recv_size)
+            except socket.timeout:
+                break
+            except OSError as e:
+                print(f"✗ Ошибка получения данных: {e}")
+                break
+            if not data:
+                break
+            for tag, attrs in self.parser.feed(data):
+                apply_ack(pending, failed, tag, attrs)
         
-        # Включаем отправку Best POG
-        self.send_command('<SET ID="ENABLE_SEND_POG_BEST" STATE="1" />')
-        time.sleep(0.1)
+        for setting_id in pending:
+            failed[setting_id] = "нет подтверждения"
         
-        print("✓ Трекер настроен")
+        if failed:
+            for setting_id, reason in failed.items():
+                print(f"⚠️ Настройка {setting_id} не применена: {reason}")
+        else:
+            print("✓ Трекер настроен")
+        return failed
     
     def start_tracking(self, max_duration_sec=None):
         """
@@ -132,23 +204,20 @@ class GazepointTracker:
         # Создаем файл CSV в папке data/raw
         os.makedirs("data/raw", exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        self.csv_filename = f"data/raw/gaze_data_{timestamp}.csv"
-        
-        # Инициализируем данные
-        self.csv_data = []
-        self.start_time = time.time() * 1000  # в миллисекундах
-        self.last_time = self.start_time
-        self.last_x = None
-        self.last_y = None
+        self.csv_filename = f"data/raw/gaze_data_{timestamp}.{self.output_format}"
         
-        # Создаем заголовок CSV
-        with open(self.csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(['x', 'y', 'T', 'Tn'])
+        # Создаем файл с заголовком, дальше данные дописываются блоками в фоне
+        self.samples = SampleBuffer(
+            self.csv_filename, FIXATION_COLUMNS, chunk_size=self.chunk_size,
+            file_format=self.output_format,
+            metadata={'host': self.host, 'port': self.port, 'started': datetime.now().isoformat()},
+        )
         
-        # Очищаем файл команд
-        with open(self.command_file, 'w') as f:
-            f.write("")
+        # Инициализируем данные
+        self.recorder.reset(self.samples)
+        self.parser.reset()
+        if self.live_heatmap:
+            self.live_heatmap.reset()
         
         # Включаем отправку данных
         success = self.send_command('<SET ID="ENABLE_SEND_DATA" STATE="1" />')
@@ -160,24 +229,39 @@ class GazepointTracker:
             self.data_thread = threading.Thread(target=self._data_loop, daemon=True)
             self.data_thread.start()
             
-            # Запускаем поток для контроля команд
-            self.control_thread = threading.Thread(target=self._control_loop, daemon=True)
-            self.control_thread.start()
+            # Автоматическое завершение по таймеру
+            if max_duration_sec:
+                self.stop_timer = threading.Timer(max_duration_sec, self._on_max_duration)
+                self.stop_timer.daemon = True
+                self.stop_timer.start()
+            
+            # Запускаем канал команд
+            try:
+                self.control.start()
+            except OSError as e:
+                print(f"⚠️ Канал управления недоступен на порту {self.control.port}: {e}")
+            
+            self.reporter.start()
+            if self.live_heatmap:
+                self.live_heatmap.start()
             
             print("🎯 Начат сбор данных с айтрекера")
             print(f"📁 Данные сохраняются в файл: {self.csv_filename}")
+            if self.live_heatmap:
+                print(f"🔥 Живая тепловая карта: {self.live_heatmap.filename}")
             
             if max_duration_sec:
                 print(f"⏰ Автоматическое завершение через {max_duration_sec} секунд")
             
             print("💡 Способы завершения:")
             print("   1. Подождите автоматического завершения (если установлено)")
-            print(f"   2. Создайте файл '{self.command_file}' с командой 'finish'")
-            print("   3. Запустите 'python control_tracker.py finish' в другой консоли")
-            print("   4. Ctrl+C для принудительного завершения")
+            print("   2. Запустите 'python -m tracker.control finish' в другой консоли")
+            print("      (также доступны: status, pause, resume, heatmap, mark ТЕКСТ)")
+            print("   3. Ctrl+C для принудительного завершения")
             
             return True
         else:
+            self.samples.close()
             print("✗ Не удалось начать отслеживание")
             return False
     
@@ -188,74 +272,94 @@ class GazepointTracker:
             self.send_command('<SET ID="ENABLE_SEND_DATA" STATE="0" />')
             self.tracking = False
             self.stop_flag.set()
+            self.reporter.stop()
+            self.control.stop()
+            if self.stop_timer:
+                self.stop_timer.cancel()
+                self.stop_timer = None
+            
+            # Дожидаемся потока данных, чтобы он не писал в закрытый буфер
+            if self.data_thread and self.data_thread is not threading.current_thread():
+                self.data_thread.join(timeout=2.0)
             
             # Сохраняем последнюю фиксацию если есть
-            if self.last_x is not None and self.last_y is not None:
-                current_time_ms = time.time() * 1000
-                T = current_time_ms - self.start_time
-                Tn = current_time_ms - self.last_time
-                self.csv_data.append((self.last_x, self.last_y, T, Tn))
+            self.recorder.finish()
+            if self.live_heatmap:
+                self.live_heatmap.stop()
             
-            # Сохраняем данные в CSV
-            self._save_csv_data()
+            # Дописываем остаток данных в файл
+            self.samples.metadata.update(self.recorder.summary(), **self.parser.stats())
+            self.samples.close()
+            self._save_events()
             
             print("⏹️ Сбор данных остановлен")
-            print(f"📊 Сохранено {len(self.csv_data)} записей в {self.csv_filename}")
+            print(f"📊 Сохранено {len(self.samples)} записей в {self.csv_filename}")
+            stats = self.parser.stats()
+            print(f"📨 Сообщений: {stats['records']}, поврежденных: {stats['malformed']}, потерянных: {stats['dropped']}")
+            print(f"📉 Пропущено пакетов трекера (по CNT): {self.recorder.lost_packets}")
             return True
         return False
     
-    def _save_csv_data(self):
-        """Сохранение накопленных данных в CSV"""
-        if self.csv_data and self.csv_filename:
-            with open(self.csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
-                writer = csv.writer(csvfile)
-                writer.writerow(['x', 'y', 'T', 'Tn'])
-                writer.writerows(self.csv_data)
+    def _status_line(self):
+        """Строка статуса для StatusReporter (вызывается из его потока)"""
+        samples = self.samples
+        if samples is None:
+            return None
+        elapsed = time.time() - self.tracking_start_time
+        row = samples.last_row
+        if row is None:
+            return f"Ожидание фиксаций... | Время: {elapsed:.1f}с"
+        x, y, T, Tn = row[:4]
+        return f"POG: ({x:.4f}, {y:.4f}) T={T:.0f}ms Tn={Tn:.0f}ms | Записей: {len(samples)} | Время: {elapsed:.1f}с"
     
-    def _is_same_position(self, x1, y1, x2, y2):
-        """Проверяет, находятся ли две точки в одной позиции (в пределах порога)"""
-        if x2 is None or y2 is None:
-            return False
-        distance = math.sqrt((x1 - x2) ** 2 + (y1 - y2) ** 2)
-        return distance < self.position_threshold
+    def _on_max_duration(self):
+        """Срабатывание таймера автоматического завершения"""
+        print(f"\n⏰ Автоматическое завершение через {self.max_duration} секунд")
+        self.stop_tracking()
     
-    def _control_loop(self):
-        """Цикл контроля команд и автоматического завершения"""
-        while self.tracking and not self.stop_flag.is_set():
-            try:
-                # Проверяем автоматическое завершение по времени
-                if self.max_duration:
-                    elapsed = time.time() - self.tracking_start_time
-                    if elapsed >= self.max_duration:
-                        print(f"\n⏰ Автоматическое завершение через {self.max_duration} секунд")
-                        self.stop_tracking()
-                        break
-                
-                # Проверяем файл команд
-                if os.path.exists(self.command_file):
-                    try:
-                        with open(self.command_file, 'r') as f:
-                            command = f.read().strip().lower()
-                        
-                        if command == 'finish' or command == 'stop':
-                            print(f"\n📄 Получена команда '{command}' из файла")
-                            self.stop_tracking()
-                            # Очищаем файл команд
-                            os.remove(self.command_file)
-                            break
-                        elif command == 'status':
-                            elapsed = time.time() - self.tracking_start_time
-                            print(f"\n🔄 Статус: собрано {len(self.csv_data)} записей, прошло {elapsed:.1f} сек")
-                            # Очищаем команду
-                            with open(self.command_file, 'w') as f:
-                                f.write("")
-                    except Exception:
-                        pass
-                
-                time.sleep(0.5)  # Проверяем каждые 0.5 секунды
-                
-            except Exception:
-                break
+    def _handle_control_command(self, command, args):
+        """Обработка команды из канала управления (поток ControlServer)"""
+        if command in ('finish', 'stop'):
+            print(f"\n📨 Получена команда '{command}'")
+            if not self.stop_tracking():
+                return "error: сбор данных не запущен"
+            return f"ok: сохранено {len(self.samples)} записей в {self.csv_filename}"
+        
+        if not self.tracking:
+            return "error: сбор данных не запущен"
+        
+        if command == 'status':
+            elapsed = time.time() - self.tracking_start_time
+            state = "пауза" if self.recorder.paused else "запись"
+            status = f"{state}, собрано {len(self.samples)} записей, прошло {elapsed:.1f} сек, потеряно пакетов {self.recorder.lost_packets}"
+            print(f"\n🔄 Статус: {status}")
+            return f"ok: {status}"
+        if command == 'pause':
+            self.recorder.paused = True
+            print("\n⏸️ Запись приостановлена")
+            return "ok: пауза"
+        if command == 'resume':
+            self.recorder.paused = False
+            print("\n▶️ Запись возобновлена")
+            return "ok: запись"
+        if command == 'heatmap':
+            if not self.live_heatmap:
+                return "error: живая тепловая карта отключена"
+            self.live_heatmap.publish()
+            return f"ok: {self.live_heatmap.filename} ({self.live_heatmap.fixations} фиксаций)"
+        if command == 'mark':
+            T = self.recorder.mark(args)
+            print(f"\n📍 Отметка T={T:.0f}ms: {args}")
+            return f"ok: T={T:.0f}"
+        return f"error: неизвестная команда '{command}'"
+    
+    def _save_events(self):
+        """Сохраняет отметки событий рядом с файлом данных"""
+        base = os.path.splitext(self.csv_filename)[0]
+        events_filename = base.replace("gaze_data_", "gaze_events_") + ".csv"
+        count = self.recorder.save_events(events_filename)
+        if count:
+            print(f"📍 Сохранено {count} отметок в {events_filename}")
     
     def _data_loop(self):
         """Основной цикл получения данных"""
@@ -265,70 +369,18 @@ class GazepointTracker:
                 self._parse_and_display_data(data)
     
     def _parse_and_display_data(self, data):
-        """Парсинг и отображение XML данных"""
-        try:
-            # Ищем REC теги в данных
-            if '<REC' in data and '/>' in data:
-                # Разбираем каждый REC тег отдельно
-                lines = data.split('\r\n')
-                for line in lines:
-                    line = line.strip()
-                    if line.startswith('<REC') and line.endswith('/>'):
-                        self._parse_rec_data(line)
-        except Exception as e:
-            # Игнорируем ошибки парсинга, чтобы не засорять вывод
-            pass
+        """Разбор порции байт из сокета на отдельные сообщения"""
+        for tag, attrs in self.parser.feed(data):
+            if tag == 'REC':
+                self._parse_rec_data(attrs)
     
-    def _parse_rec_data(self, rec_line):
-        """Парсинг отдельной записи REC"""
+    def _parse_rec_data(self, attrs):
+        """Обработка атрибутов отдельной записи REC"""
         try:
-            # Парсим XML
-            root = ET.fromstring(rec_line)
-            
-            # Извлекаем атрибуты
-            time_val = root.get('TIME')
-            bpogx = root.get('BPOGX')
-            bpogy = root.get('BPOGY')
-            bpogv = root.get('BPOGV')
-            
-            # Отображаем только если есть данные Best POG
-            if time_val and bpogx and bpogy and bpogv:
-                current_x = float(bpogx)
-                current_y = float(bpogy)
-                is_valid = bpogv == "1"
-                
-                # Показываем только валидные данные
-                if is_valid and current_x > 0 and current_y > 0:
-                    current_time_ms = time.time() * 1000
-                    T = current_time_ms - self.start_time
-                    
-                    # Проверяем, изменилась ли позиция
-                    if not self._is_same_position(current_x, current_y, self.last_x, self.last_y):
-                        # Новая позиция - сохраняем предыдущую фиксацию (если была)
-                        if self.last_x is not None and self.last_y is not None:
-                            # Время фиксации в предыдущей позиции
-                            Tn = current_time_ms - self.last_time
-                            
-                            # Добавляем запись в CSV
-                            self.csv_data.append((self.last_x, self.last_y, T, Tn))
-                            
-                            # Выводим в консоль
-                            timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-                            elapsed = time.time() - self.tracking_start_time
-                            print(f"[{timestamp}] POG: ({self.last_x:.4f}, {self.last_y:.4f}) T={T:.0f}ms Tn={Tn:.0f}ms | Записей: {len(self.csv_data)} | Время: {elapsed:.1f}с")
-                            
-                            self.last_time = current_time_ms
-                        
-                        # Начинаем новую фиксацию
-                        self.last_x = current_x
-                        self.last_y = current_y
-                        self.current_fixation_start = current_time_ms
-                    
-                    # Если позиция та же, просто продолжаем фиксацию (не создаем запись)
-                    
-        except Exception as e:
-            # Игнорируем ошибки парсинга отдельных записей
-            pass
+            self.recorder.process(attrs)
+        except ValueError:
+            # Некорректные числовые значения в записи
+            self.parser.malformed += 1
     
     def run_with_commands(self):
         """Запуск трекера с обработкой команд"""
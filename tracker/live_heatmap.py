@@ -0,0 +1,167 @@
+import os
+import threading
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class LiveHeatmap:
+    """
+    Тепловая карта, обновляемая во время записи.
+
+    Каждая фиксация добавляет свою длительность Tn в четыре соседних
+    узла сетки (линейное бинирование) - O(1) на фиксацию, без пересчета
+    KDE. При заданном half_life вклад фиксаций затухает: новые фиксации
+    добавляются с весом 2^(T/half_life), так что вся сетка не умножается
+    на множитель затухания при каждом обновлении. Отдельный поток не чаще
+    одного раза за interval секунд сглаживает сетку гауссовым фильтром и
+    публикует снимок (нормированный на максимум) в файл .npy и/или функцию.
+    """
+
+    # Предел роста веса при затухании (показатель степени 2, ~1e90), после которого
+    # сетка перенормируется; сравнивается показатель, чтобы 2 ** x не переполнился
+    RESCALE_EXPONENT = 300
+
+    def __init__(self, filename: Optional[str] = None, width: int = 64, height: int = 36,
+                 half_life: Optional[float] = None, interval: float = 0.5, sigma: float = 1.5,
+                 publish_fn: Optional[Callable[[np.ndarray], None]] = None):
+        """
+        :param filename: Файл .npy для снимков (перезаписывается атомарно)
+        :param width: Ширина сетки в узлах
+        :param height: Высота сетки в узлах
+        :param half_life: Период полузатухания в секундах (None - накопительная карта)
+        :param interval: Период публикации снимков в секундах
+        :param sigma: Ширина сглаживания в узлах сетки
+        :param publish_fn: Функция, получающая снимок (height x width, float32)
+        """
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.half_life = half_life
+        self.interval = interval
+        self.publish_fn = publish_fn
+        self.kernel = self._gaussian_kernel(sigma)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.reset()
+
+    def reset(self):
+        """Очищает карту перед новой записью"""
+        with self._lock:
+            self.grid = np.zeros((self.height, self.width))
+            self.fixations = 0
+            self._version = 0
+            self._published = -1
+            self._time_origin = 0.0  # T (мс), относительно которого считается вес затухания
+
+    def add(self, x: float, y: float, T: float, Tn: float, lost: int = 0):
+        """
+        Добавляет фиксацию (сигнатура совпадает со строкой FIXATION_COLUMNS)
+        :param x: Координата X (доля экрана)
+        :param y: Координата Y (доля экрана, сверху вниз)
+        :param T: Время окончания фиксации от начала записи, мс
+        :param Tn: Длительность фиксации, мс
+        """
+        fx = x * (self.width - 1)
+        fy = y * (self.height - 1)
+        if not (0 <= fx <= self.width - 1 and 0 <= fy <= self.height - 1):
+            return
+        ix = min(int(fx), self.width - 2)
+        iy = min(int(fy), self.height - 2)
+        tx = fx - ix
+        ty = fy - iy
+
+        with self._lock:
+            weight = max(Tn, 0.0)
+            if self.half_life:
+                exponent = (T - self._time_origin) / (self.half_life * 1000)
+                if exponent > self.RESCALE_EXPONENT:
+                    # Переносим начало отсчета, чтобы веса не переполнились; после
+                    # долгой паузы множитель уходит в 0 и старые фиксации обнуляются
+                    self.grid *= 2.0 ** -exponent
+                    self._time_origin = T
+                    exponent = 0.0
+                weight *= 2.0 ** exponent
+            grid = self.grid
+            grid[iy, ix] += weight * (1 - tx) * (1 - ty)
+            grid[iy, ix + 1] += weight * tx * (1 - ty)
+            grid[iy + 1, ix] += weight * (1 - tx) * ty
+            grid[iy + 1, ix + 1] += weight * tx * ty
+            self.fixations += 1
+            self._version += 1
+
+    def snapshot(self) -> np.ndarray:
+        """Сглаженная карта, нормированная на максимум (height x width, float32)"""
+        with self._lock:
+            grid = self.grid.copy()
+        Z = self._blur(grid)
+        peak = Z.max()
+        if peak > 0:
+            Z /= peak
+        return Z.astype(np.float32)
+
+    def start(self):
+        """Запускает поток публикации снимков"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает поток и публикует итоговый снимок"""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.publish()
+
+    def publish(self):
+        """Публикует снимок, если с прошлой публикации были новые фиксации"""
+        version = self._version
+        if version == self._published:
+            return
+        Z = self.snapshot()
+        self._published = version
+        if self.filename:
+            self._save(Z)
+        if self.publish_fn:
+            self.publish_fn(Z)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish()
+            except Exception as e:
+                print(f"✗ Ошибка публикации тепловой карты: {e}")
+
+    def _save(self, Z: np.ndarray):
+        """Атомарная запись снимка: читатель не увидит недописанный файл"""
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_filename = self.filename + '.tmp'
+        with open(temp_filename, 'wb') as f:
+            np.save(f, Z)
+        os.replace(temp_filename, self.filename)
+
+    @staticmethod
+    def _gaussian_kernel(sigma: float) -> np.ndarray:
+        radius = max(int(np.ceil(3 * sigma)), 1)
+        offsets = np.arange(-radius, radius + 1)
+        kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+        return kernel / kernel.sum()
+
+    def _blur(self, grid: np.ndarray) -> np.ndarray:
+        """Разделимое гауссово сглаживание сдвигами (сетка маленькая, без scipy)"""
+        radius = len(self.kernel) // 2
+        for axis in (0, 1):
+            padded = np.pad(grid, [(radius, radius) if a == axis else (0, 0) for a in (0, 1)])
+            size = grid.shape[axis]
+            grid = sum(
+                weight * (padded[offset:offset + size] if axis == 0 else padded[:, offset:offset + size])
+                for offset, weight in enumerate(self.kernel)
+            )
+        return grid
@@ -0,0 +1,59 @@
+"""
+Команды настройки Gazepoint Open Gaze API и разбор подтверждений.
+"""
+
+from typing import Dict, Iterable
+
+# Короткие имена полей и соответствующие им идентификаторы ENABLE_SEND_*
+FIELD_IDS = {
+    'time': 'ENABLE_SEND_TIME',
+    'time_tick': 'ENABLE_SEND_TIME_TICK',
+    'counter': 'ENABLE_SEND_COUNTER',
+    'pog_best': 'ENABLE_SEND_POG_BEST',
+    'pog_fix': 'ENABLE_SEND_POG_FIX',
+    'pog_left': 'ENABLE_SEND_POG_LEFT',
+    'pog_right': 'ENABLE_SEND_POG_RIGHT',
+    'pupil_left': 'ENABLE_SEND_PUPIL_LEFT',
+    'pupil_right': 'ENABLE_SEND_PUPIL_RIGHT',
+    'eye_left': 'ENABLE_SEND_EYE_LEFT',
+    'eye_right': 'ENABLE_SEND_EYE_RIGHT',
+    'blink': 'ENABLE_SEND_BLINK',
+    'cursor': 'ENABLE_SEND_CURSOR',
+}
+
+# Поля, необходимые для записи фиксаций по Best POG
+DEFAULT_FIELDS = ('time', 'counter', 'pog_best')
+
+
+def resolve_fields(fields: Iterable[str]) -> Dict[str, str]:
+    """
+    Преобразует список полей в ожидаемые значения настроек {ID: STATE}
+    :param fields: Короткие имена из FIELD_IDS или полные идентификаторы ENABLE_SEND_*
+    """
+    return {FIELD_IDS.get(field.lower(), field.upper()): '1' for field in fields}
+
+
+def build_set_commands(settings: Dict[str, str]) -> bytes:
+    """Формирует пакет команд SET для отправки одним вызовом"""
+    return b''.join(
+        f'<SET ID="{setting_id}" STATE="{state}" />\r\n'.encode('utf-8')
+        for setting_id, state in settings.items()
+    )
+
+
+def apply_ack(pending: Dict[str, str], failed: Dict[str, str], tag: str, attrs: Dict[str, str]):
+    """
+    Сопоставляет ответ сервера с ожидаемыми настройками
+    :param pending: Еще не подтвержденные настройки {ID: STATE}, подтвержденные удаляются
+    :param failed: Сюда добавляются отклоненные настройки {ID: причина}
+    """
+    if tag not in ('ACK', 'NACK'):
+        return
+    setting_id = attrs.get('ID')
+    if setting_id not in pending:
+        return
+    expected = pending.pop(setting_id)
+    if tag == 'NACK':
+        failed[setting_id] = "отклонено сервером (NACK)"
+    elif attrs.get('STATE', expected) != expected:
+        failed[setting_id] = f"STATE={attrs.get('STATE')} вместо {expected}"
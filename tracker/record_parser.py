@@ -0,0 +1,86 @@
+import re
+from typing import Dict, List, Tuple
+
+
+# Атрибуты вида NAME="value" внутри XML-сообщения Open Gaze API
+_ATTR_RE = re.compile(r'([A-Za-z0-9_]+)="([^"]*)"')
+# Имя тега сообщения: <REC ...>, <ACK ...>, <NACK ...>
+_TAG_RE = re.compile(r'<([A-Za-z]+)')
+
+
+class RecordStreamParser:
+    """
+    Инкрементальный разборщик потока сообщений Gazepoint.
+
+    Накапливает байты между вызовами recv(), выделяет целые сообщения
+    по разделителю строк и извлекает атрибуты без построения XML-дерева.
+    Неполная запись в конце буфера сохраняется до следующего чтения.
+    """
+
+    def __init__(self, max_buffer_size: int = 65536):
+        """
+        :param max_buffer_size: Максимальный размер незавершенного сообщения в байтах.
+            Если разделитель так и не пришел, буфер сбрасывается и учитывается как потеря.
+        """
+        self.max_buffer_size = max_buffer_size
+        self._buffer = b""
+        self.records = 0  # Корректно разобранные сообщения
+        self.malformed = 0  # Сообщения с нарушенной структурой или значениями
+        self.dropped = 0  # Сообщения, потерянные при переполнении буфера
+
+    def reset(self):
+        """Сбрасывает буфер и счетчики перед новой сессией"""
+        self._buffer = b""
+        self.records = 0
+        self.malformed = 0
+        self.dropped = 0
+
+    def feed(self, chunk: bytes) -> List[Tuple[str, Dict[str, str]]]:
+        """
+        Добавляет очередную порцию байт из сокета
+        :param chunk: Данные, полученные из recv()
+        :return: Список завершенных сообщений (тег, атрибуты)
+        """
+        data = self._buffer + chunk if self._buffer else chunk
+        lines = data.split(b"\n")
+        # Последний элемент - начало еще не пришедшего сообщения (или пустая строка)
+        tail = lines.pop()
+        if len(tail) > self.max_buffer_size:
+            self.dropped += 1
+            tail = b""
+        self._buffer = tail
+
+        messages = []
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            message = self._parse_message(line)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    def _parse_message(self, line: bytes):
+        """Разбирает одно сообщение вида <TAG A="1" B="2" />"""
+        if not (line.startswith(b"<") and line.endswith(b"/>")):
+            self.malformed += 1
+            return None
+        try:
+            text = line.decode("utf-8")
+        except UnicodeDecodeError:
+            self.malformed += 1
+            return None
+        tag_match = _TAG_RE.match(text)
+        if tag_match is None:
+            self.malformed += 1
+            return None
+        self.records += 1
+        return tag_match.group(1), dict(_ATTR_RE.findall(text))
+
+    def stats(self) -> Dict[str, int]:
+        """Счетчики разобранных, поврежденных и потерянных сообщений"""
+        return {
+            'records': self.records,
+            'malformed': self.malformed,
+            'dropped': self.dropped,
+        }
@@ -0,0 +1,183 @@
+import csv
+import json
+import queue
+import threading
+from concurrent.futures import Executor, Future
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class SampleBuffer:
+    """
+    Колоночный буфер отсчетов с фоновой записью на диск.
+
+    Отсчеты складываются в заранее выделенный блок float64 размером
+    chunk_size x len(columns). Заполненный блок передается фоновому
+    потоку записи, а сбор продолжается в следующий свободный блок из пула.
+    В памяти одновременно находится не более pool_size блоков, поэтому
+    расход памяти не зависит от длительности записи, а при сбое теряется
+    не больше одного незаписанного блока.
+
+    Вместо собственного потока записи можно передать общий executor
+    (например, ThreadPoolExecutor(max_workers=1) на несколько трекеров).
+    Executor должен быть однопоточным, чтобы блоки писались по порядку.
+
+    Формат 'npy' пишет записи в двоичный файл NumPy со структурным типом
+    (по полю float64 на колонку), который читается через np.load(mmap_mode='r')
+    без разбора текста. Заголовок обновляется после каждого блока, поэтому
+    файл остается корректным и во время записи. Метаданные сессии
+    сохраняются рядом в файл .json.
+    """
+
+    # Размер заголовка .npy с запасом под любое количество строк
+    NPY_HEADER_SIZE = 256
+
+    def __init__(self, filename: str, columns: Sequence[str] = ('x', 'y', 'T', 'Tn'),
+                 chunk_size: int = 1024, pool_size: int = 4, executor: Optional[Executor] = None,
+                 file_format: str = 'csv', metadata: Optional[Dict[str, Any]] = None):
+        """
+        :param filename: Путь к файлу (заголовок записывается при открытии)
+        :param columns: Названия колонок
+        :param chunk_size: Количество строк в одном блоке
+        :param pool_size: Количество блоков в пуле (ограничивает расход памяти)
+        :param executor: Общий однопоточный executor для записи (по умолчанию - свой поток)
+        :param file_format: 'csv' - текстовый CSV, 'npy' - двоичный файл NumPy с метаданными в .json
+        :param metadata: Метаданные сессии для формата 'npy' (можно дополнять до close())
+        """
+        if file_format not in ('csv', 'npy'):
+            raise ValueError(f"Неизвестный формат файла: {file_format}")
+        self.filename = filename
+        self.file_format = file_format
+        self.metadata: Dict[str, Any] = dict(metadata or {})
+        self.columns = tuple(columns)
+        self.chunk_size = chunk_size
+
+        self._free: "queue.Queue[np.ndarray]" = queue.Queue()
+        for _ in range(pool_size):
+            self._free.put(np.empty((chunk_size, len(self.columns)), dtype=np.float64))
+        self._pending: "queue.Queue[Optional[tuple]]" = queue.Queue()
+
+        self._chunk = self._free.get()
+        self._fill = 0
+        self._flushed = 0
+        self.last_row: Optional[tuple] = None
+        self.write_error: Optional[Exception] = None
+
+        self._written = 0
+        if file_format == 'npy':
+            self._dtype = np.dtype([(column, '<f8') for column in self.columns])
+            self._file = open(self.filename, 'wb')
+            self._write_npy_header()
+        else:
+            self._file = open(self.filename, 'w', newline='', encoding='utf-8')
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.columns)
+        self._file.flush()
+
+        self._executor = executor
+        self._futures: List[Future] = []
+        self._closed = False
+        self._thread: Optional[threading.Thread] = None
+        if executor is None:
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+    def __len__(self):
+        return self._flushed + self._fill
+
+    def append(self, *row: float):
+        """Добавляет одну строку значений в порядке колонок"""
+        self._chunk[self._fill] = row
+        self._fill += 1
+        self.last_row = row
+        if self._fill == self.chunk_size:
+            self._submit()
+
+    def _submit(self):
+        """Передает текущий блок на запись и берет свободный из пула"""
+        if self._executor is not None:
+            self._futures = [f for f in self._futures if not f.done()]
+            self._futures.append(self._executor.submit(self._write_and_release, self._chunk, self._fill))
+        else:
+            self._pending.put((self._chunk, self._fill))
+        self._flushed += self._fill
+        # Если запись отстает, ждем освобождения блока вместо роста памяти
+        self._chunk = self._free.get()
+        self._fill = 0
+
+    def _write_loop(self):
+        """Фоновый поток: записывает заполненные блоки в файл"""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            self._write_and_release(*item)
+
+    def _write_and_release(self, chunk: np.ndarray, rows: int):
+        """Записывает блок и возвращает его в пул свободных"""
+        try:
+            self._write_chunk(chunk[:rows])
+        except Exception as e:
+            self.write_error = e
+        finally:
+            self._free.put(chunk)
+
+    def _write_chunk(self, rows: np.ndarray):
+        """Дописывает строки блока в файл и сбрасывает его на диск"""
+        if self.file_format == 'npy':
+            # Строка float64 по колонкам совпадает с записью структурного типа
+            self._file.write(np.ascontiguousarray(rows, dtype='<f8').tobytes())
+            self._written += len(rows)
+            self._write_npy_header()
+            self._file.seek(0, 2)
+        else:
+            self._writer.writerows(rows.tolist())
+            self._written += len(rows)
+        self._file.flush()
+
+    def _write_npy_header(self):
+        """Записывает (перезаписывает) заголовок .npy фиксированного размера"""
+        header = repr({
+            'descr': np.lib.format.dtype_to_descr(self._dtype),
+            'fortran_order': False,
+            'shape': (self._written,),
+        })
+        # Магическая строка, версия 1.0, длина заголовка (uint16), заголовок с '\n' в конце
+        header_len = self.NPY_HEADER_SIZE - 10
+        header = header.ljust(header_len - 1) + '\n'
+        if len(header) > header_len:
+            raise ValueError("Слишком много колонок для заголовка .npy")
+        self._file.seek(0)
+        self._file.write(b'\x93NUMPY\x01\x00' + header_len.to_bytes(2, 'little') + header.encode('latin1'))
+
+    def _write_metadata(self):
+        """Сохраняет метаданные сессии рядом с двоичным файлом"""
+        metadata = dict(self.metadata, columns=list(self.columns), rows=self._written)
+        with open(metadata_path(self.filename), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    def close(self):
+        """Записывает остаток данных, дожидается фонового потока и закрывает файл"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._fill:
+            self._submit()
+        if self._thread is not None:
+            self._pending.put(None)
+            self._thread.join()
+            self._thread = None
+        for future in self._futures:
+            future.result()
+        self._futures = []
+        self._file.close()
+        if self.file_format == 'npy':
+            self._write_metadata()
+        if self.write_error is not None:
+            print(f"✗ Ошибка записи данных: {self.write_error}")
+
+
+def metadata_path(filename: str) -> str:
+    """Путь к файлу метаданных сессии для двоичной записи"""
+    return filename.rsplit('.', 1)[0] + '.json'
@@ -0,0 +1,50 @@
+import threading
+from datetime import datetime
+from typing import Callable, Optional
+
+
+class StatusReporter:
+    """
+    Периодический вывод статуса сбора данных в отдельном потоке.
+
+    Поток чтения сокета только обновляет счетчики, а строка статуса
+    формируется и печатается здесь не чаще одного раза за interval секунд,
+    поэтому медленный терминал не тормозит прием данных.
+    """
+
+    def __init__(self, status_fn: Callable[[], Optional[str]], interval: Optional[float] = 1.0):
+        """
+        :param status_fn: Функция, возвращающая строку статуса (None - нечего выводить)
+        :param interval: Период вывода в секундах (None или 0 - вывод отключен)
+        """
+        self.status_fn = status_fn
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.interval)
+
+    def start(self):
+        """Запускает поток вывода (если вывод включен)"""
+        if not self.enabled or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает поток вывода"""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def _loop(self):
+        # Event.wait просыпается сразу при остановке, без опроса
+        while not self._stop.wait(self.interval):
+            line = self.status_fn()
+            if line:
+                timestamp = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+                print(f"[{timestamp}] {line}")